@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from account.models import User, File
+from account.models import User, File, EmailOutbox
 
 class UserModelAdmin(BaseUserAdmin):
     list_display = ('id', 'email', 'first_name', 'last_name', 'address', 'phone', 'age', 'is_admin', 'created_at')
@@ -22,3 +22,4 @@ class UserModelAdmin(BaseUserAdmin):
 
 admin.site.register(User, UserModelAdmin)
 admin.site.register(File)
+admin.site.register(EmailOutbox)
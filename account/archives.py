@@ -0,0 +1,79 @@
+import io
+import os
+import zipfile
+
+from django.utils import timezone
+
+from account.compression import decoded
+from account.downloads import DOWNLOAD_CHUNK_SIZE
+
+COMPRESSION_METHODS = {
+    'store': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+}
+
+# Write-only, unseekable sink for ZipFile. Because it can't seek, zipfile
+# writes each entry's sizes in a trailing data descriptor instead of going back
+# to patch the header, so the archive can be sent as it is produced.
+class ZipStream(io.RawIOBase):
+    def __init__(self):
+        self.buffer = []
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    # Hand over everything written since the last call
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer.clear()
+        return data
+
+# Unique archive member name for a display name ("a.txt", "a (1).txt", ...)
+def archive_name(name, used):
+    candidate = name.replace('\\', '_').lstrip('/') or 'file'
+    stem, ext = os.path.splitext(candidate)
+    counter = 1
+    while candidate in used:
+        candidate = f'{stem} ({counter}){ext}'
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+# Yield a ZIP archive of the given File rows piece by piece. Only one read
+# buffer and one entry's compressor state are held at a time; ZIP64 records
+# are used automatically for large entries and archives.
+def stream_zip(files, compression=zipfile.ZIP_STORED):
+    sink = ZipStream()
+    used = set()
+    with zipfile.ZipFile(sink, 'w', compression=compression, allowZip64=True) as archive:
+        for file_instance in files:
+            stored = file_instance.file
+            try:
+                source = decoded(stored.storage.open(stored.name, 'rb'), file_instance.encoding)
+            except FileNotFoundError:
+                continue
+            with source:
+                info = zipfile.ZipInfo(
+                    archive_name(file_instance.name, used),
+                    date_time=timezone.localtime(file_instance.uploaded_at).timetuple()[:6],
+                )
+                info.compress_type = compression
+                info.file_size = file_instance.size if file_instance.size is not None else source.size
+                with archive.open(info, 'w') as entry:
+                    while chunk := source.read(DOWNLOAD_CHUNK_SIZE):
+                        entry.write(chunk)
+                        if data := sink.drain():
+                            yield data
+            if data := sink.drain():
+                yield data
+    # Closing the archive wrote the central directory
+    yield sink.drain()
@@ -0,0 +1,174 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Authenticated users are cached for AUTH_USER_CACHE_TTL seconds, either in a
+# per-process LRU ('local') or in a Django cache shared by every worker
+# ('shared', using AUTH_USER_CACHE_ALIAS). Saves and deletes invalidate the
+# entry immediately; with 'local', other processes see the change once the
+# TTL runs out.
+AUTH_USER_CACHE = getattr(settings, 'AUTH_USER_CACHE', 'local')
+AUTH_USER_CACHE_ALIAS = getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')
+AUTH_USER_CACHE_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+AUTH_USER_CACHE_SIZE = getattr(settings, 'AUTH_USER_CACHE_SIZE', 4096)
+
+class LocalUserCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+        # Callers get their own copy so request-local changes never leak into the cache
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, copy.copy(user))
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class SharedUserCache:
+    def __init__(self, alias, ttl):
+        self.alias = alias
+        self.ttl = ttl
+
+    def key(self, user_id):
+        return f'auth:user:{user_id}'
+
+    def get(self, user_id):
+        return caches[self.alias].get(self.key(user_id))
+
+    def set(self, user_id, user):
+        caches[self.alias].set(self.key(user_id), user, self.ttl)
+
+    def delete(self, user_id):
+        caches[self.alias].delete(self.key(user_id))
+
+    def clear(self):
+        pass
+
+if AUTH_USER_CACHE == 'shared':
+    user_cache = SharedUserCache(AUTH_USER_CACHE_ALIAS, AUTH_USER_CACHE_TTL)
+else:
+    user_cache = LocalUserCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL)
+
+# Drop a user from the authentication cache, e.g. after their row changed
+def invalidate_cached_user(user_id):
+    user_cache.delete(user_id)
+
+# File list pages are cached under a per-user version token. Every change to
+# a user's files replaces the token, so old pages are simply never looked up
+# again (no key scans). Replacing rather than incrementing keeps the bump a
+# single atomic set() on every cache backend, including file and database.
+# The token must be seen by every worker, so a per-process locmem cache turns
+# list caching off rather than serve pages another worker has invalidated.
+FILE_LIST_CACHE_ALIAS = getattr(settings, 'FILE_LIST_CACHE_ALIAS', 'default')
+FILE_LIST_CACHE_TTL = getattr(settings, 'FILE_LIST_CACHE_TTL', 300)
+
+def file_list_cache_enabled():
+    return not isinstance(caches[FILE_LIST_CACHE_ALIAS], LocMemCache)
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+file_list_stats = CacheStats()
+
+def _file_list_version_key(user_id):
+    return f'files:version:{user_id}'
+
+def file_list_version(user_id):
+    cache = caches[FILE_LIST_CACHE_ALIAS]
+    key = _file_list_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+def file_list_page_key(user_id, version, query_string):
+    return f'files:list:{user_id}:{version}:{hashlib.md5(query_string.encode()).hexdigest()}'
+
+# (key, data); the key is None when list caching is off
+def get_cached_file_list(user_id, query_string):
+    if not file_list_cache_enabled():
+        return None, None
+    version = file_list_version(user_id)
+    key = file_list_page_key(user_id, version, query_string)
+    data = caches[FILE_LIST_CACHE_ALIAS].get(key)
+    file_list_stats.record(data is not None)
+    return key, data
+
+def set_cached_file_list(key, data):
+    if key is None:
+        return
+    caches[FILE_LIST_CACHE_ALIAS].set(key, data, FILE_LIST_CACHE_TTL)
+
+def bump_file_list_version(user_id):
+    if not file_list_cache_enabled():
+        return
+    caches[FILE_LIST_CACHE_ALIAS].set(_file_list_version_key(user_id), uuid.uuid4().hex, None)
+
+# Invalidate a user's cached listings once the current transaction commits
+def invalidate_file_list(user_id):
+    transaction.on_commit(lambda: bump_file_list_version(user_id))
+
+# Rendered profile bodies, stored with the updated_at they were built from so
+# a copy that outlived an update is never served. Saves evict them outright.
+PROFILE_CACHE_ALIAS = getattr(settings, 'PROFILE_CACHE_ALIAS', 'default')
+PROFILE_CACHE_TTL = getattr(settings, 'PROFILE_CACHE_TTL', 300)
+
+profile_stats = CacheStats()
+
+def _profile_key(user_id):
+    return f'profile:{user_id}'
+
+def get_cached_profile(user):
+    entry = caches[PROFILE_CACHE_ALIAS].get(_profile_key(user.pk))
+    body = entry[1] if entry is not None and entry[0] == user.updated_at else None
+    profile_stats.record(body is not None)
+    return body
+
+def set_cached_profile(user, body):
+    caches[PROFILE_CACHE_ALIAS].set(_profile_key(user.pk), (user.updated_at, body), PROFILE_CACHE_TTL)
+
+def invalidate_cached_profile(user_id):
+    caches[PROFILE_CACHE_ALIAS].delete(_profile_key(user_id))
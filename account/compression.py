@@ -0,0 +1,104 @@
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# zstandard is optional; without it FILE_COMPRESSION = 'zstd' falls back to gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Uploads to upload/ can be stored compressed: None (off), 'gzip' or 'zstd'.
+# Only new uploads are affected; files already stored keep their encoding.
+FILE_COMPRESSION = getattr(settings, 'FILE_COMPRESSION', None)
+GZIP_LEVEL = getattr(settings, 'FILE_COMPRESSION_GZIP_LEVEL', 6)
+ZSTD_LEVEL = getattr(settings, 'FILE_COMPRESSION_ZSTD_LEVEL', 3)
+
+# A file is stored compressed only if its first chunk shrinks below this
+# fraction of its size at the fastest zlib level
+COMPRESSIBLE_RATIO = 0.9
+
+# Leading bytes of formats that are compressed already
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b',            # gzip
+    b'PK\x03\x04',          # zip, docx, xlsx, jar, ...
+    b'(\xb5/\xfd',          # zstd
+    b'BZh',                 # bzip2
+    b'\xfd7zXZ\x00',        # xz
+    b'7z\xbc\xaf\x27\x1c',  # 7z
+    b'Rar!',
+    b'\x89PNG',
+    b'\xff\xd8\xff',        # jpeg
+    b'GIF8',
+    b'OggS',
+    b'fLaC',
+    b'ID3',                 # mp3
+    b'\x1aE\xdf\xa3',       # matroska, webm
+)
+
+# Suffix added to blob names so bytes with different encodings never share a name
+ENCODING_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+def compression_encoding():
+    if FILE_COMPRESSION == 'zstd' and zstandard is None:
+        return 'gzip'
+    return FILE_COMPRESSION or ''
+
+# Sniff the first chunk of an upload
+def is_compressible(sample):
+    if not sample or sample.startswith(COMPRESSED_SIGNATURES) or sample[4:8] == b'ftyp':  # ftyp: mp4, mov, heic
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * COMPRESSIBLE_RATIO
+
+# Incremental compressor with compress(data) and flush()
+def compressor(encoding):
+    if encoding == 'gzip':
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+def _zstandard():
+    if zstandard is None:
+        raise ImproperlyConfigured('zstd-compressed files need the zstandard package')
+    return zstandard
+
+# Read-only file object producing the decoded bytes of an open stored file.
+# read(n) never returns more than n bytes, however well the data compressed.
+class DecodedFile:
+    def __init__(self, handle, encoding):
+        self.handle = handle
+        if encoding == 'gzip':
+            self.reader = gzip.GzipFile(fileobj=handle, mode='rb')
+        else:
+            self.reader = _zstandard().ZstdDecompressor().stream_reader(handle, closefd=False)
+
+    def read(self, size=-1):
+        return self.reader.read(size)
+
+    def close(self):
+        self.reader.close()
+        self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def decoded(handle, encoding):
+    return DecodedFile(handle, encoding) if encoding else handle
+
+# Whether Accept-Encoding allows sending the stored bytes as they are
+def accepts_encoding(request, encoding):
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip().lower() not in (encoding, '*'):
+            continue
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            return match is None or float(match.group(1)) > 0
+        except ValueError:
+            return False
+    return False
@@ -0,0 +1,311 @@
+import hashlib
+import secrets
+import time
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from account.compression import accepts_encoding, decoded
+from account.models import File
+
+# Size of each read while streaming a stored file to the client
+DOWNLOAD_CHUNK_SIZE = getattr(settings, 'FILE_DOWNLOAD_CHUNK_SIZE', 64 * 1024)
+
+# Requests asking for more ranges than this are answered with the full body
+MAX_RANGES = getattr(settings, 'FILE_DOWNLOAD_MAX_RANGES', 16)
+
+# Signed download URLs: default and maximum lifetime in seconds
+SIGNED_URL_TTL = getattr(settings, 'FILE_SIGNED_URL_TTL', 300)
+SIGNED_URL_MAX_TTL = getattr(settings, 'FILE_SIGNED_URL_MAX_TTL', 3600)
+SIGNED_URL_SALT = 'account.downloads.signed-url'
+
+# How verified signed downloads are served: None streams them from Python,
+# 'x-accel-redirect' hands nginx FILE_DOWNLOAD_ACCEL_PREFIX + storage name,
+# 'x-sendfile' hands Apache/lighttpd the absolute path
+DOWNLOAD_OFFLOAD = getattr(settings, 'FILE_DOWNLOAD_OFFLOAD', None)
+DOWNLOAD_ACCEL_PREFIX = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected/')
+
+# FileResponse that reads in bounded chunks. Under WSGI servers that provide
+# wsgi.file_wrapper (gunicorn, uWSGI, ...) the open file is handed to the
+# server as-is so it can use sendfile instead of copying through Python.
+class ChunkedFileResponse(FileResponse):
+    block_size = DOWNLOAD_CHUNK_SIZE
+
+# Strong validator derived from the storage key, size and upload time. A new
+# upload always gets a new storage key, so the tag changes with the content.
+def file_etag(file_instance, size):
+    identity = f'{file_instance.file.name}:{size}:{file_instance.uploaded_at.isoformat()}'
+    return quote_etag(hashlib.sha1(identity.encode()).hexdigest())
+
+# Parse a Range header into a list of inclusive (start, end) pairs.
+# Returns None when the header should be ignored and [] when no range is satisfiable.
+def parse_range_header(header, size):
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        start, sep, end = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if start:
+                start = int(start)
+                end = int(end) if end else size - 1
+                if end < start:
+                    return None
+            elif end:
+                length = int(end)
+                start, end = max(size - length, 0), size - 1
+                if length == 0:
+                    continue
+            else:
+                return None
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    # Coalesce overlapping or adjacent ranges so a client can't ask for the same bytes repeatedly
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+# If-Range only allows a partial response when the client's validator still matches
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+# Yield the bytes between start and end (inclusive) in bounded chunks
+def read_range(handle, start, end):
+    handle.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = handle.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+# Async counterpart of read_range for ASGI: each read runs on a worker thread
+# and the event loop only waits for the client between chunks
+async def aread_range(handle, start, end):
+    read = sync_to_async(handle.read, thread_sensitive=False)
+    await sync_to_async(handle.seek, thread_sensitive=False)(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+def _multipart_body(handle, ranges, headers, boundary):
+    for (start, end), part_headers in zip(ranges, headers):
+        yield part_headers
+        yield from read_range(handle, start, end)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+async def _amultipart_body(handle, ranges, headers, boundary):
+    for (start, end), part_headers in zip(ranges, headers):
+        yield part_headers
+        async for chunk in aread_range(handle, start, end):
+            yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+# Build a 206 response for one or more byte ranges of an open file. With
+# asynchronous=True the body is an async iterator, for ASGI views.
+def partial_response(handle, ranges, size, content_type, asynchronous=False):
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        body = aread_range(handle, start, end) if asynchronous else read_range(handle, start, end)
+        response = StreamingHttpResponse(body, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        boundary = secrets.token_hex(16)
+        headers = [
+            f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n'.encode()
+            for start, end in ranges
+        ]
+        length = sum(len(h) + end - start + 1 + 2 for h, (start, end) in zip(headers, ranges))
+        length += len(f'--{boundary}--\r\n')
+        body = (_amultipart_body if asynchronous else _multipart_body)(handle, ranges, headers, boundary)
+        response = StreamingHttpResponse(
+            body, status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = length
+    response._resource_closers.append(handle.close)
+    return response
+
+# Open the stored bytes of a File, turning a missing file into a 404
+def open_stored(file_instance):
+    stored = file_instance.file
+    try:
+        return stored.storage.open(stored.name, 'rb')
+    except FileNotFoundError:
+        raise Http404("File does not exist")
+
+def read_chunks(reader):
+    while chunk := reader.read(DOWNLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def aread_chunks(reader):
+    read = sync_to_async(reader.read, thread_sensitive=False)
+    while chunk := await read(DOWNLOAD_CHUNK_SIZE):
+        yield chunk
+
+# Serve a file stored compressed. Clients accepting its encoding get the stored
+# bytes with Content-Encoding (a separate representation, so its own ETag);
+# others get it decoded while streaming. Ranges are not offered for either.
+def serve_encoded_file(request, file_instance, content_type, asynchronous=False):
+    encoding = file_instance.encoding
+    passthrough = accepts_encoding(request, encoding)
+    etag = file_etag(file_instance, file_instance.size)
+    if passthrough:
+        etag = f'{etag[:-1]}-{encoding}"'
+    last_modified = int(file_instance.uploaded_at.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        handle = open_stored(file_instance)
+        reader = handle if passthrough else decoded(handle, encoding)
+        body = aread_chunks(reader) if asynchronous else read_chunks(reader)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response._resource_closers.append(reader.close)
+        if passthrough:
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = file_instance.stored_size
+        else:
+            response['Content-Length'] = file_instance.size
+        response['Content-Disposition'] = content_disposition_header(True, file_instance.name)
+
+    response['Accept-Ranges'] = 'none'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+# Stream a File instance as an attachment named after its display name,
+# honouring conditional requests (ETag / Last-Modified) and byte ranges.
+# Size and type come from the row, so only opening the file touches storage.
+# ASGI views pass asynchronous=True to get a body the server can await.
+def serve_file(request, file_instance, content_type, asynchronous=False):
+    if file_instance.encoding:
+        return serve_encoded_file(request, file_instance, content_type, asynchronous)
+    stored = file_instance.file
+    size = file_instance.size
+    if size is None:
+        # Rows not yet backfilled by `manage.py backfill_file_metadata`
+        try:
+            size = stored.storage.size(stored.name)
+        except FileNotFoundError:
+            raise Http404("File does not exist")
+    etag = file_etag(file_instance, size)
+    last_modified = int(file_instance.uploaded_at.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        ranges = None
+        if request.method in ('GET', 'HEAD') and if_range_matches(request, etag, last_modified):
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif ranges and ranges != [(0, size - 1)]:
+            handle = open_stored(file_instance)
+            response = partial_response(handle, ranges, size, content_type, asynchronous)
+            response['Content-Disposition'] = content_disposition_header(True, file_instance.name)
+        elif asynchronous:
+            handle = open_stored(file_instance)
+            response = StreamingHttpResponse(aread_range(handle, 0, size - 1), content_type=content_type)
+            response['Content-Length'] = size
+            response['Content-Disposition'] = content_disposition_header(True, file_instance.name)
+            response._resource_closers.append(handle.close)
+        else:
+            handle = open_stored(file_instance)
+            response = ChunkedFileResponse(handle, as_attachment=True, filename=file_instance.name, content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+# A token naming everything needed to serve the file (storage name, display
+# name, type, size, upload time) plus its expiry, HMAC-signed with SECRET_KEY,
+# so verifying and serving it needs no database access
+def sign_download(file_instance, expires_in=SIGNED_URL_TTL):
+    expires = int(time.time()) + min(expires_in, SIGNED_URL_MAX_TTL)
+    payload = {
+        'n': file_instance.file.name,
+        'd': file_instance.name,
+        't': file_instance.content_type,
+        's': file_instance.size,
+        'c': file_instance.encoding,
+        'z': file_instance.stored_size,
+        'u': file_instance.uploaded_at.timestamp(),
+        'e': expires,
+    }
+    return signing.dumps(payload, salt=SIGNED_URL_SALT, compress=True), expires
+
+# Payload of a valid, unexpired token; raises signing.BadSignature otherwise
+def verify_download(token):
+    payload = signing.loads(token, salt=SIGNED_URL_SALT)
+    if payload['e'] < time.time():
+        raise signing.SignatureExpired('Download link expired')
+    return payload
+
+# Unsaved File carrying just what serve_file needs, built from a verified payload
+def file_from_payload(payload):
+    return File(
+        file=payload['n'], name=payload['d'], content_type=payload['t'], size=payload['s'],
+        encoding=payload.get('c', ''), stored_size=payload.get('z'), uploaded_at=datetime.fromtimestamp(payload['u'], tz=dt_timezone.utc),
+    )
+
+# Empty response telling the front proxy which file to send
+def offload_response(file_instance, content_type):
+    response = HttpResponse(content_type=content_type)
+    if DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+        # nginx expects a URI here: percent-encode names with spaces or non-ASCII
+        response['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX + quote(file_instance.file.name)
+    else:
+        response['X-Sendfile'] = file_instance.file.path
+    response['Content-Disposition'] = content_disposition_header(True, file_instance.name)
+    return response
+
+# Serve a verified signed download through the proxy when one is configured,
+# otherwise stream it here. Compressed files go to the proxy only for clients
+# that accept their encoding; the rest are decoded here.
+def serve_signed_file(request, payload):
+    file_instance = file_from_payload(payload)
+    content_type = file_instance.content_type or 'application/octet-stream'
+    if DOWNLOAD_OFFLOAD:
+        if not file_instance.encoding:
+            return offload_response(file_instance, content_type)
+        if accepts_encoding(request, file_instance.encoding):
+            response = offload_response(file_instance, content_type)
+            response['Content-Encoding'] = file_instance.encoding
+            patch_vary_headers(response, ['Accept-Encoding'])
+            return response
+    return serve_file(request, file_instance, content_type)
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import close_old_connections
+
+# Password hashing work (login, registration) runs on a small dedicated pool
+# so a burst of logins can't occupy every worker. At most
+# HASHING_WORKERS + HASHING_QUEUE_SIZE jobs are admitted at once; anything
+# beyond that is refused immediately instead of queueing without bound.
+HASHING_WORKERS = getattr(settings, 'PASSWORD_HASHING_WORKERS', 4)
+HASHING_QUEUE_SIZE = getattr(settings, 'PASSWORD_HASHING_QUEUE_SIZE', 32)
+
+_executor = ThreadPoolExecutor(max_workers=HASHING_WORKERS, thread_name_prefix='password-hashing')
+_slots = threading.BoundedSemaphore(HASHING_WORKERS + HASHING_QUEUE_SIZE)
+
+class HashingQueueFull(Exception):
+    pass
+
+# PBKDF2 with the iteration count taken from settings. It keeps Django's
+# algorithm name, so existing hashes still verify; hashes made with a
+# different count are re-encoded on the user's next successful login.
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Pool threads outlive requests, so tidy up DB connections like a request would
+        close_old_connections()
+
+def _release(future):
+    _slots.release()
+
+# Schedule fn on the hashing pool, raising HashingQueueFull when it is saturated
+def submit(fn, *args, **kwargs):
+    if not _slots.acquire(blocking=False):
+        raise HashingQueueFull()
+    try:
+        future = _executor.submit(_run, fn, args, kwargs)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(_release)
+    return future
+
+async def run_in_hashing_pool(fn, *args, **kwargs):
+    return await asyncio.wrap_future(submit(fn, *args, **kwargs))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from account.cache import bump_file_list_version
+from account.models import File
+from account.storage import guess_content_type, hash_content
+
+
+class Command(BaseCommand):
+    help = 'Record size, content type and checksum for files uploaded before they were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = missing = 0
+        last_id = 0
+        while True:
+            batch = list(
+                File.objects.filter(id__gt=last_id, size__isnull=True).select_related('blob')
+                .order_by('id')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            changed = []
+            for file_instance in batch:
+                if file_instance.blob is not None:
+                    # Deduplicated content was hashed when its blob was written
+                    file_instance.size = file_instance.blob.size
+                    file_instance.checksum = file_instance.blob.digest
+                else:
+                    stored = file_instance.file
+                    try:
+                        with stored.storage.open(stored.name, 'rb') as content:
+                            file_instance.checksum, file_instance.size = hash_content(content)
+                    except FileNotFoundError:
+                        missing += 1
+                        continue
+                file_instance.content_type = guess_content_type(file_instance.name)
+                changed.append(file_instance)
+
+            File.objects.bulk_update(changed, ['size', 'content_type', 'checksum'])
+            for user_id in {file_instance.user_id for file_instance in changed}:
+                bump_file_list_version(user_id)
+            updated += len(changed)
+
+        self.stdout.write(f'Backfilled {updated} files, {missing} missing from storage.')
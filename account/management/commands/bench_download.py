@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from account.downloads import ChunkedFileResponse
+
+
+class Command(BaseCommand):
+    help = 'Measure peak Python memory while streaming a large file through the download response'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=2048, help='Size of the generated file in MB')
+        parser.add_argument('--compare-read', action='store_true', help='Also measure reading the whole file into memory')
+
+    def handle(self, *args, **options):
+        size = options['size_mb'] * 1024 * 1024
+
+        # A sparse file keeps the benchmark from needing real disk space
+        fd, path = tempfile.mkstemp(suffix='.bin')
+        try:
+            os.ftruncate(fd, size)
+            os.close(fd)
+
+            self.report('streamed', *self.measure_streamed(path))
+            if options['compare_read']:
+                self.report('read()', *self.measure_read(path))
+        finally:
+            os.remove(path)
+
+    # Iterate the streaming response the way a WSGI server without sendfile would
+    def measure_streamed(self, path):
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = ChunkedFileResponse(open(path, 'rb'), as_attachment=True, filename='bench.bin')
+        sent = 0
+        for chunk in response:
+            sent += len(chunk)
+        response.close()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return sent, peak, elapsed
+
+    # The previous behaviour: one read() of the whole file
+    def measure_read(self, path):
+        tracemalloc.start()
+        started = time.perf_counter()
+        with open(path, 'rb') as file:
+            sent = len(file.read())
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return sent, peak, elapsed
+
+    def report(self, label, sent, peak, elapsed):
+        self.stdout.write(
+            f'{label:>8}: {sent / 2**20:,.0f} MB sent, peak memory {peak / 2**10:,.1f} KB, '
+            f'{elapsed:.2f}s ({sent / 2**20 / max(elapsed, 1e-9):,.0f} MB/s)'
+        )
@@ -0,0 +1,55 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.response import Response
+
+from account import renderers
+from account.renderers import UserRenderer
+
+
+# The renderer as it was before: repr() the payload, then json.dumps it
+def legacy_render(data):
+    if 'ErrorDetail' in str(data):
+        return json.dumps({'errors': data})
+    return json.dumps(data)
+
+
+class Command(BaseCommand):
+    help = 'Compare UserRenderer against the previous repr-based renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000)
+        parser.add_argument('--list-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        profile = {
+            'id': 1, 'email': 'user@example.com', 'first_name': 'Test', 'last_name': 'User',
+            'address': 'Somewhere 1', 'phone': '0000000', 'age': 30, 'no_of_files_uploaded': 4,
+        }
+        file_list = {
+            'next': None, 'previous': None,
+            'results': [
+                {'id': i, 'file': f'/media/uploads/{i}.pdf', 'name': f'{i}.pdf', 'uploaded_at': '2024-07-24T11:57:00Z'}
+                for i in range(options['list_size'])
+            ],
+        }
+        errors = {
+            'email': [ErrorDetail('Enter a valid email address.', code='invalid')],
+            'password': [ErrorDetail('This field is required.', code='required')],
+        }
+        payloads = [('profile', profile, 200), ('list', file_list, 200), ('error', errors, 400)]
+
+        renderer = UserRenderer()
+        backend = 'orjson' if renderers.orjson is not None else 'json'
+        self.stdout.write(f'UserRenderer backend: {backend}')
+        for label, data, status in payloads:
+            context = {'response': Response(data, status=status)}
+            number = max(1, options['number'] // (50 if label == 'list' else 1))
+            legacy = timeit.timeit(lambda: legacy_render(data), number=number) / number
+            current = timeit.timeit(lambda: renderer.render(data, renderer_context=context), number=number) / number
+            self.stdout.write(
+                f'{label:>8}: legacy {legacy * 1e6:9.1f} us  current {current * 1e6:9.1f} us  '
+                f'({legacy / current:.1f}x)'
+            )
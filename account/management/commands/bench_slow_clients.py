@@ -0,0 +1,120 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from account.models import User
+from account.storage import build_file
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent slow downloads through the sync view on N WSGI threads and the async view under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--size-kb', type=int, default=1024)
+        parser.add_argument('--delay', type=float, default=0.02, help='Seconds each client waits per received chunk')
+
+    # Runs like the test suite: against a freshly created test database, a
+    # temporary media root and local-memory caches, so the configured
+    # database, files and shared caches are never touched
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        caches = {alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'bench-{alias}'} for alias in settings.CACHES}
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, CACHES=caches):
+                self.benchmark(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def benchmark(self, options):
+        user = User.objects.create_user(
+            email='bench-slow-clients@example.invalid', first_name='Bench', last_name='User',
+            address='-', phone='-', age=0, password=None,
+        )
+        file_instance = build_file(SimpleUploadedFile('bench.bin', b'\0' * options['size_kb'] * 1024), 'bench.bin', user)
+        file_instance.save()
+        token = f'Bearer {AccessToken.for_user(user)}'
+
+        started = time.perf_counter()
+        sent = self.run_wsgi(reverse('file-view', args=[file_instance.id]), token, options)
+        self.report(f'WSGI ({options["workers"]} threads)', sent, time.perf_counter() - started, options)
+
+        started = time.perf_counter()
+        sent = asyncio.run(self.run_asgi(reverse('async-file-view', args=[file_instance.id]), token, options))
+        self.report('ASGI (1 event loop)', sent, time.perf_counter() - started, options)
+
+    def run_wsgi(self, path, token, options):
+        handler = WSGIHandler()
+
+        def client(_):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SERVER_NAME': 'testserver', 'SERVER_PORT': '80',
+                'HTTP_AUTHORIZATION': token, 'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http',
+            }
+            received = 0
+            body = handler(environ, lambda status, headers: None)
+            try:
+                for chunk in body:
+                    received += len(chunk)
+                    time.sleep(options['delay'])
+            finally:
+                body.close()
+            return received
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            return sum(pool.map(client, range(options['clients'])))
+
+    async def run_asgi(self, path, token, options):
+        handler = ASGIHandler()
+
+        async def client():
+            received = 0
+            disconnected = asyncio.Event()
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal received
+                if message['type'] == 'http.response.body':
+                    received += len(message.get('body', b''))
+                    await asyncio.sleep(options['delay'])
+
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'scheme': 'http',
+                'server': ('testserver', 80), 'headers': [(b'authorization', token.encode())],
+            }
+            await handler(scope, receive, send)
+            disconnected.set()
+            return received
+
+        return sum(await asyncio.gather(*[client() for _ in range(options['clients'])]))
+
+    def report(self, label, sent, elapsed, options):
+        self.stdout.write(
+            f'{label:>20}: {options["clients"]} clients, {sent / 2**20:,.1f} MB in {elapsed:.2f}s '
+            f'({options["clients"] / max(elapsed, 1e-9):,.1f} downloads/s)'
+        )
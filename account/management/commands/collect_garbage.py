@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from account.models import Blob, File, StorageTombstone
+from account.storage import blob_storage
+
+
+class Command(BaseCommand):
+    help = 'Delete the stored bytes of removed files in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--grace-seconds', type=int,
+            default=int(getattr(settings, 'GC_GRACE_PERIOD', timedelta(minutes=5)).total_seconds()),
+            help='Only collect tombstones at least this old',
+        )
+
+    def handle(self, *args, **options):
+        storage = blob_storage()
+        cutoff = timezone.now() - timedelta(seconds=options['grace_seconds'])
+        deleted = kept = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # The tombstones stay locked until their bytes are gone, so
+                # store_blob cannot revive a name between the reference check
+                # and the delete (it removes the tombstone before reusing bytes)
+                batch = list(
+                    StorageTombstone.objects.select_for_update()
+                    .filter(id__gt=last_id, created_at__lte=cutoff)
+                    .order_by('id').values_list('id', 'name')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                # A name can be referenced again after it was buried (e.g. the same
+                # content uploaded anew); those bytes must stay
+                names = {name for _, name in batch}
+                referenced = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+                referenced |= set(Blob.objects.filter(file__in=names).values_list('file', flat=True))
+
+                for name in names - referenced:
+                    storage.delete(name)
+                deleted += len(names - referenced)
+                kept += len(names & referenced)
+                StorageTombstone.objects.filter(id__in=[tombstone_id for tombstone_id, _ in batch]).delete()
+
+        self.stdout.write(f'Deleted {deleted} stored files, kept {kept} that are referenced again.')
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from account.compression import compressor, decoded
+from account.downloads import DOWNLOAD_CHUNK_SIZE
+from account.models import File
+
+
+class Command(BaseCommand):
+    help = 'Report space saved by at-rest compression and its CPU cost, per content type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=5, help='Compressed files per type to time')
+
+    def handle(self, *args, **options):
+        rows = (
+            File.objects.values('content_type')
+            .annotate(
+                files=Count('id'),
+                compressed=Count('id', filter=~Q(encoding='')),
+                original=Coalesce(Sum('size'), 0),
+                stored=Coalesce(Sum(Coalesce('stored_size', 'size')), 0),
+            )
+            .order_by(F('original').desc())
+        )
+        self.stdout.write(
+            f'{"content type":<40} {"files":>7} {"compr.":>7} {"original MB":>12} {"stored MB":>10} '
+            f'{"saved":>7} {"encode ms/MB":>13} {"decode ms/MB":>13}'
+        )
+        for row in rows:
+            saved = 1 - row['stored'] / row['original'] if row['original'] else 0
+            encode, decode = self.cpu_cost(row['content_type'], options['sample'])
+            self.stdout.write(
+                f'{row["content_type"] or "-":<40} {row["files"]:>7} {row["compressed"]:>7} '
+                f'{row["original"] / 2**20:>12,.2f} {row["stored"] / 2**20:>10,.2f} {saved:>7.1%} '
+                f'{self.format_cost(encode):>13} {self.format_cost(decode):>13}'
+            )
+
+    # CPU milliseconds per MB of content to decode a few stored files of this
+    # type and to encode them again, or None when none are compressed
+    def cpu_cost(self, content_type, sample):
+        files = File.objects.filter(content_type=content_type).exclude(encoding='').order_by('-id')[:sample]
+        encode_time = decode_time = 0.0
+        content_bytes = 0
+        for file_instance in files:
+            stored = file_instance.file
+            try:
+                reader = decoded(stored.storage.open(stored.name, 'rb'), file_instance.encoding)
+            except FileNotFoundError:
+                continue
+            encoder = compressor(file_instance.encoding)
+            with reader:
+                while True:
+                    started = time.process_time()
+                    chunk = reader.read(DOWNLOAD_CHUNK_SIZE)
+                    decode_time += time.process_time() - started
+                    if not chunk:
+                        break
+                    started = time.process_time()
+                    encoder.compress(chunk)
+                    encode_time += time.process_time() - started
+                    content_bytes += len(chunk)
+            encoder.flush()
+        if not content_bytes:
+            return None, None
+        megabytes = content_bytes / 2**20
+        return encode_time * 1000 / megabytes, decode_time * 1000 / megabytes
+
+    def format_cost(self, value):
+        return '-' if value is None else f'{value:,.1f}'
@@ -0,0 +1,64 @@
+import hashlib
+import os
+
+from django.core.files.move import file_move_safe
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from account.cache import invalidate_file_list
+from account.models import Blob, File
+from account.storage import blob_name, blob_storage, schedule_deletion
+
+
+class Command(BaseCommand):
+    help = 'Move files uploaded before deduplication into content-addressed blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        storage = blob_storage()
+        linked = duplicates = missing = 0
+        last_id = 0
+        while True:
+            # Compressed files are left alone: their stored bytes are not the content to hash
+            batch = list(File.objects.filter(blob__isnull=True, encoding='', id__gt=last_id).order_by('id')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            for file_instance in batch:
+                old_name = file_instance.file.name
+                if not storage.exists(old_name):
+                    missing += 1
+                    continue
+                digest, size = self.hash_stored(storage, old_name)
+                name = blob_name(digest)
+
+                with transaction.atomic():
+                    blob = Blob.objects.select_for_update().filter(digest=digest).first()
+                    if blob is None:
+                        # First copy of this content: move it into place rather than copying
+                        target = storage.path(name)
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        file_move_safe(storage.path(old_name), target, allow_overwrite=True)
+                        blob = Blob.objects.create(digest=digest, file=name, size=size, ref_count=1)
+                    else:
+                        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                        schedule_deletion([old_name])
+                        duplicates += 1
+                    File.objects.filter(pk=file_instance.pk).update(file=name, blob=blob)
+                    invalidate_file_list(file_instance.user_id)
+                linked += 1
+
+        self.stdout.write(f'Linked {linked} files to blobs, removed {duplicates} duplicate copies, {missing} files missing.')
+
+    def hash_stored(self, storage, name):
+        sha256 = hashlib.sha256()
+        size = 0
+        with storage.open(name, 'rb') as stored:
+            for chunk in stored.chunks():
+                sha256.update(chunk)
+                size += len(chunk)
+        return sha256.hexdigest(), size
@@ -0,0 +1,59 @@
+import os
+import uuid
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from account.models import UploadSession
+from account.uploads import UPLOAD_SESSION_DIR, UPLOAD_SESSION_TTL, remove_session_files, remove_stale_incoming
+
+
+class Command(BaseCommand):
+    help = 'Delete expired chunked upload sessions and their parts on disk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        removed = 0
+        while True:
+            expired = list(
+                UploadSession.objects.filter(expires_at__lte=timezone.now()).values_list('id', flat=True)[:batch_size]
+            )
+            if not expired:
+                break
+            UploadSession.objects.filter(id__in=expired).delete()
+            for session_id in expired:
+                remove_session_files(session_id)
+            removed += len(expired)
+
+        self.stdout.write(
+            f'Removed {removed} expired sessions, {self.remove_stray(batch_size)} stray part directories '
+            f'and {remove_stale_incoming(UPLOAD_SESSION_TTL)} stale incoming uploads.'
+        )
+
+    # Part directories whose session row is already gone, e.g. after a crash mid-finalize
+    def remove_stray(self, batch_size):
+        root = default_storage.path(UPLOAD_SESSION_DIR)
+        if not os.path.isdir(root):
+            return 0
+        with os.scandir(root) as entries:
+            names = [entry.name for entry in entries if entry.is_dir() and self.is_uuid(entry.name)]
+
+        stray = 0
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            live = {str(pk) for pk in UploadSession.objects.filter(id__in=batch).values_list('id', flat=True)}
+            for name in batch:
+                if name not in live:
+                    remove_session_files(name)
+                    stray += 1
+        return stray
+
+    def is_uuid(self, name):
+        try:
+            return str(uuid.UUID(name)) == name
+        except ValueError:
+            return False
@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.models import Blob, File, StorageTombstone
+from account.storage import blob_storage, schedule_deletion
+from account.uploads import UPLOAD_SESSION_DIR
+
+
+class Command(BaseCommand):
+    help = 'Find stored files no File or Blob refers to and queue them for collect_garbage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--min-age', type=int, default=3600, help='Ignore files modified in the last N seconds (uploads in flight)')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.root = blob_storage().path('')
+        self.newest = time.time() - options['min_age']
+        scanned = orphaned = 0
+        batch = []
+        for name in self.walk(self.root):
+            batch.append(name)
+            if len(batch) >= options['batch_size']:
+                orphaned += self.check(batch, options['dry_run'])
+                scanned += len(batch)
+                batch = []
+        if batch:
+            orphaned += self.check(batch, options['dry_run'])
+            scanned += len(batch)
+        self.stdout.write(f'Scanned {scanned} files, {orphaned} orphaned.')
+
+    # Depth-first walk yielding storage names; memory grows with depth, not with file count
+    def walk(self, path):
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.relpath(entry.path, self.root) != UPLOAD_SESSION_DIR:
+                        yield from self.walk(entry.path)
+                elif entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < self.newest:
+                    yield os.path.relpath(entry.path, self.root).replace(os.sep, '/')
+
+    def check(self, names, dry_run):
+        names = set(names)
+        names -= set(File.objects.filter(file__in=names).values_list('file', flat=True))
+        names -= set(Blob.objects.filter(file__in=names).values_list('file', flat=True))
+        names -= set(StorageTombstone.objects.filter(name__in=names).values_list('name', flat=True))
+        if dry_run:
+            for name in sorted(names):
+                self.stdout.write(name)
+        elif names:
+            schedule_deletion(sorted(names))
+        return len(names)
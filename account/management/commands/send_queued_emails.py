@@ -0,0 +1,137 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from account.models import EmailOutbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails in batches over a single reused mail connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50))
+        parser.add_argument('--max-attempts', type=int, default=getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting once it is drained')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait between polls with --loop')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.max_attempts = options['max_attempts']
+        self.retry_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 30)
+        while True:
+            sent, failed = self.drain()
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed attempts.')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    # Send every due email, reusing one connection until the outbox is empty
+    def drain(self):
+        sent = failed = 0
+        mail_connection = None
+        try:
+            while True:
+                batch = self.claim_batch()
+                if not batch:
+                    break
+                if mail_connection is None:
+                    mail_connection = get_connection()
+                    try:
+                        mail_connection.open()
+                    except Exception as exc:
+                        for message in batch:
+                            self.record_failure(message, exc)
+                        failed += len(batch)
+                        mail_connection = None
+                        break
+                batch_sent, batch_failed, connected = self.send_batch(mail_connection, batch)
+                sent += batch_sent
+                failed += batch_failed
+                if not connected:
+                    mail_connection = None
+                    break
+        finally:
+            if mail_connection is not None:
+                mail_connection.close()
+        return sent, failed
+
+    # Lease a batch of due messages. Rows stay 'sending' until delivered; if the
+    # worker dies the lease runs out and another worker picks them up again.
+    def claim_batch(self):
+        now = timezone.now()
+        with transaction.atomic():
+            due = EmailOutbox.objects.filter(
+                status__in=[EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENDING],
+                next_attempt_at__lte=now,
+            ).order_by('next_attempt_at')
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            batch = list(due[:self.batch_size])
+            if batch:
+                EmailOutbox.objects.filter(id__in=[message.id for message in batch]).update(
+                    status=EmailOutbox.STATUS_SENDING,
+                    next_attempt_at=now + timedelta(minutes=5),
+                )
+        return batch
+
+    # Returns (sent, failed, connected); connected is False when the mail
+    # server could not be reached again after a failure
+    def send_batch(self, mail_connection, batch):
+        delivered = []
+        failed = 0
+        connected = True
+        for position, message in enumerate(batch):
+            email = EmailMessage(
+                subject=message.subject,
+                body=message.body,
+                from_email=message.from_email or None,
+                to=[message.to_email],
+                connection=mail_connection,
+            )
+            try:
+                email.send()
+            except Exception as exc:
+                self.record_failure(message, exc)
+                failed += 1
+                # The failure may have dropped the connection; reusing it would
+                # fail every remaining message, so start a fresh one
+                mail_connection.close()
+                try:
+                    mail_connection.open()
+                except Exception as open_exc:
+                    remaining = batch[position + 1:]
+                    for pending in remaining:
+                        self.record_failure(pending, open_exc)
+                    failed += len(remaining)
+                    connected = False
+                    break
+            else:
+                delivered.append(message.id)
+
+        EmailOutbox.objects.filter(id__in=delivered).update(
+            status=EmailOutbox.STATUS_SENT,
+            sent_at=timezone.now(),
+            last_error='',
+        )
+        return len(delivered), failed, connected
+
+    # Retry with exponential backoff until max_attempts, then give up
+    def record_failure(self, message, exc):
+        attempts = message.attempts + 1
+        if attempts >= self.max_attempts:
+            status = EmailOutbox.STATUS_FAILED
+        else:
+            status = EmailOutbox.STATUS_PENDING
+        delay = self.retry_delay * 2 ** (attempts - 1)
+        EmailOutbox.objects.filter(id=message.id).update(
+            status=status,
+            attempts=attempts,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+            last_error=str(exc)[:1000],
+        )
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+
+from account.cache import bump_file_list_version
+from account.models import File, sharded_upload_to
+
+
+class Command(BaseCommand):
+    help = 'Move files from the flat uploads/ directory into the sharded layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    # Each file is first hard-linked (or copied) to its new path, then the row
+    # is switched over, and only then is the old path removed, so downloads
+    # keep working at every step and the command can be stopped at any time
+    def handle(self, *args, **options):
+        storage = File._meta.get_field('file').storage
+        moved = skipped = 0
+        last_id = 0
+        while True:
+            batch = list(
+                File.objects.filter(id__gt=last_id, blob__isnull=True, file__regex=r'^uploads/[^/]+$')
+                .order_by('id').values_list('id', 'user_id', 'file')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            for file_id, user_id, old_name in batch:
+                old_path = storage.path(old_name)
+                if not os.path.exists(old_path):
+                    skipped += 1
+                    continue
+                new_name = storage.get_available_name(sharded_upload_to(File(user_id=user_id), os.path.basename(old_name)))
+                if options['dry_run']:
+                    self.stdout.write(f'{old_name} -> {new_name}')
+                    continue
+
+                new_path = storage.path(new_name)
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                try:
+                    os.link(old_path, new_path)
+                except OSError:
+                    shutil.copy2(old_path, new_path)
+
+                # Only switch rows that still point at the old path
+                if File.objects.filter(id=file_id, file=old_name).update(file=new_name):
+                    os.remove(old_path)
+                    bump_file_list_version(user_id)
+                    moved += 1
+                else:
+                    os.remove(new_path)
+                    skipped += 1
+
+        self.stdout.write(f'Moved {moved} files into sharded directories, skipped {skipped}.')
@@ -0,0 +1,229 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from account.cache import file_list_stats, profile_stats
+
+# Per-process request metrics in the Prometheus text format, served at
+# /metrics. Every request is timed and sized; DB queries are only counted
+# for a METRICS_SAMPLE_RATE fraction of requests, since that wraps every
+# cursor execute. With METRICS_ENABLED off the middleware removes itself.
+# Each worker process reports its own series; Prometheus sums them per job.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in labels]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        with _lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(zip(self.labelnames, labels))} {value}'
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+
+    # Each series is [count per bucket..., count above the last bucket, sum]
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        with _lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self.series.items())
+        for labels, series in snapshot:
+            pairs = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(pairs + [("le", bound)])} {cumulative}'
+            cumulative += series[-2]
+            yield f'{self.name}_bucket{_format_labels(pairs + [("le", "+Inf")])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(pairs)} {series[-1]}'
+            yield f'{self.name}_count{_format_labels(pairs)} {cumulative}'
+
+requests_total = Counter('http_requests_total', 'Requests by view, method and status.', ('view', 'method', 'status'))
+request_duration = Histogram('http_request_duration_seconds', 'Time until the view returned a response.', ('view',), LATENCY_BUCKETS)
+response_size = Histogram('http_response_size_bytes', 'Response body sizes, streamed bodies included.', ('view',), SIZE_BUCKETS)
+request_body_bytes = Counter('http_request_body_bytes_total', 'Request body bytes received (uploads).', ('view',))
+response_body_bytes = Counter('http_response_body_bytes_total', 'Response body bytes sent (downloads).', ('view',))
+sampled_requests = Counter('http_sampled_requests_total', 'Requests whose DB queries were recorded.', ('view',))
+db_queries = Histogram('db_queries_per_request', 'DB queries per sampled request.', ('view',), QUERY_COUNT_BUCKETS)
+db_query_seconds = Counter('db_query_seconds_total', 'Time spent in DB queries by sampled requests.', ('view',))
+
+METRICS = [
+    requests_total, request_duration, response_size, request_body_bytes,
+    response_body_bytes, sampled_requests, db_queries, db_query_seconds,
+]
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.append('# HELP cache_requests_total Lookups in the file list and profile caches.')
+    lines.append('# TYPE cache_requests_total counter')
+    for cache, stats in (('file_list', file_list_stats), ('profile', profile_stats)):
+        lines.append(f'cache_requests_total{{cache="{cache}",result="hit"}} {stats.hits}')
+        lines.append(f'cache_requests_total{{cache="{cache}",result="miss"}} {stats.misses}')
+    return '\n'.join(lines) + '\n'
+
+# Counts and times the queries run on this thread's connection
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+def _start_recording(recorder):
+    connection.execute_wrappers.append(recorder)
+
+def _stop_recording(recorder):
+    connection.execute_wrappers.remove(recorder)
+
+def _view_label(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+def _counted(content, view):
+    sent = 0
+    try:
+        for chunk in content:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        _record_streamed(view, sent)
+
+async def _acounted(content, view):
+    sent = 0
+    try:
+        async for chunk in content:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        _record_streamed(view, sent)
+
+def _record_streamed(view, sent):
+    response_body_bytes.inc((view,), sent)
+    response_size.observe((view,), sent)
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 0.1)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if random.random() < self.sample_rate:
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        else:
+            recorder = None
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    # Under ASGI, sync views and the sync_to_async calls of async views run on
+    # the request's thread-sensitive worker thread, so the recorder is put on
+    # that thread's connection. Queries from thread_sensitive=False calls
+    # (parsing uploads) use other connections and are not counted.
+    async def __acall__(self, request):
+        recorder = QueryRecorder() if random.random() < self.sample_rate else None
+        if recorder is not None:
+            await sync_to_async(_start_recording)(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            elapsed = time.perf_counter() - started
+        finally:
+            if recorder is not None:
+                await sync_to_async(_stop_recording)(recorder)
+        self.record(request, response, elapsed, recorder)
+        return response
+
+    def record(self, request, response, elapsed, recorder):
+        view = _view_label(request)
+        requests_total.inc((view, request.method, response.status_code))
+        request_duration.observe((view,), elapsed)
+
+        try:
+            received = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            received = 0
+        if received:
+            request_body_bytes.inc((view,), received)
+
+        if recorder is not None:
+            sampled_requests.inc((view,))
+            db_queries.observe((view,), recorder.count)
+            db_query_seconds.inc((view,), recorder.duration)
+
+        if not response.streaming:
+            response_body_bytes.inc((view,), len(response.content))
+            response_size.observe((view,), len(response.content))
+        elif response.has_header('Content-Length'):
+            # Known length: leave the body untouched so sendfile/file_wrapper still applies
+            _record_streamed(view, int(response['Content-Length']))
+        elif response.is_async:
+            response.streaming_content = _acounted(response.streaming_content, view)
+        else:
+            response.streaming_content = _counted(response.streaming_content, view)
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-17 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_uploadsession_uploadchunk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', 'uploaded_at', 'id'], name='file_user_uploaded_idx'),
+        ),
+    ]
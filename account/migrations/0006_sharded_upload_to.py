@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-17 01:34
+
+import account.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=account.models.sharded_upload_to),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Renames no longer touch storage, so File.name is the only display name.
+# Rows that never had one get the basename of their storage key.
+
+import os
+
+from django.db import migrations
+
+
+def fill_display_names(apps, schema_editor):
+    File = apps.get_model('account', 'File')
+    missing = File.objects.filter(name='').only('id', 'file')
+    updated = []
+    for file_instance in missing.iterator(chunk_size=1000):
+        file_instance.name = os.path.basename(file_instance.file.name)[:255]
+        updated.append(file_instance)
+        if len(updated) >= 1000:
+            File.objects.bulk_update(updated, ['name'])
+            updated = []
+    if updated:
+        File.objects.bulk_update(updated, ['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_sharded_upload_to'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_display_names, migrations.RunPython.noop),
+    ]
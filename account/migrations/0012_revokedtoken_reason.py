@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0011_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revokedtoken',
+            name='reason',
+            field=models.CharField(choices=[('logout', 'Logout'), ('rotated', 'Rotated')], default='logout', max_length=10),
+        ),
+    ]
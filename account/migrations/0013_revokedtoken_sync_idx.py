@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0012_revokedtoken_reason'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='revokedtoken',
+            index=models.Index(fields=['reason', 'revoked_at'], name='revokedtoken_sync_idx'),
+        ),
+    ]
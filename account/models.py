@@ -1,4 +1,12 @@
+import hashlib
+import secrets
+import uuid
+from django.conf import settings
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+from account.cache import invalidate_cached_profile, invalidate_cached_user
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
 
 class UserManager(BaseUserManager):
@@ -31,6 +39,26 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    # Reserve upload slots with one conditional UPDATE so concurrent uploads
+    # can never push a user past the limit. Returns False when over quota.
+    # updated_at moves too, since the counter is part of the profile.
+    def claim_file_slots(self, user_id, count):
+        limit = getattr(settings, 'MAX_FILES_PER_USER', 20)
+        updated = self.filter(pk=user_id, no_of_files_uploaded__lte=limit - count).update(
+            no_of_files_uploaded=F('no_of_files_uploaded') + count, updated_at=Now(),
+        )
+        invalidate_cached_user(user_id)
+        invalidate_cached_profile(user_id)
+        return updated == 1
+
+    # Give slots back after files are deleted
+    def release_file_slots(self, user_id, count):
+        self.filter(pk=user_id).update(
+            no_of_files_uploaded=Greatest(F('no_of_files_uploaded') - count, 0), updated_at=Now(),
+        )
+        invalidate_cached_user(user_id)
+        invalidate_cached_profile(user_id)
+
 class User(AbstractBaseUser):
     email = models.EmailField(
         verbose_name='Email',
@@ -67,11 +95,149 @@ class User(AbstractBaseUser):
     def is_staff(self):
         return self.is_admin
 
+# One stored copy of some content, shared by every File with the same SHA-256
+class Blob(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/', max_length=255)
+    size = models.PositiveBigIntegerField()
+    encoding = models.CharField(max_length=16, blank=True)  # '', 'gzip' or 'zstd' (see account.compression)
+    stored_size = models.PositiveBigIntegerField(null=True, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+# uploads/<user shard>/<random shard>/<name>: two levels of at most 256
+# directories each, so no single directory grows with the number of files
+def sharded_upload_to(instance, filename):
+    user_shard = hashlib.sha1(str(instance.user_id).encode()).hexdigest()[:2]
+    return f'uploads/{user_shard}/{secrets.token_hex(1)}/{filename}'
+
 class File(models.Model):
-    file = models.FileField(upload_to='uploads/')
+    file = models.FileField(upload_to=sharded_upload_to, max_length=255)
     name = models.CharField(max_length=255)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='files')
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)  # SHA-256 of the content
+    # How the bytes are stored: '' for as uploaded, or compressed ('gzip', 'zstd').
+    # size and checksum always describe the uploaded content.
+    encoding = models.CharField(max_length=16, blank=True)
+    stored_size = models.PositiveBigIntegerField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serves the keyset-paginated file list without a sort step
+            models.Index(fields=['user', 'uploaded_at', 'id'], name='file_user_uploaded_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+# A stored name whose bytes should be removed by the collect_garbage command.
+# Requests only write these rows, in the same transaction as the delete.
+class StorageTombstone(models.Model):
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.name
+
+# A JWT (access or refresh) that must no longer be accepted, identified by its
+# jti. Rows are only needed until the token would have expired anyway; the
+# prune_revoked_tokens command removes them after that. Refresh tokens used up
+# by rotation are recorded too, but only to make each one single use; only
+# logout revocations are loaded into the in-memory list (account.revocation).
+class RevokedToken(models.Model):
+    REASON_LOGOUT = 'logout'
+    REASON_ROTATED = 'rotated'
+    REASON_CHOICES = [
+        (REASON_LOGOUT, 'Logout'),
+        (REASON_ROTATED, 'Rotated'),
+    ]
+
+    jti = models.CharField(max_length=255, unique=True)
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES, default=REASON_LOGOUT)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Serves the incremental sync (logout rows revoked since the last
+            # one) without scanning every unexpired row
+            models.Index(fields=['reason', 'revoked_at'], name='revokedtoken_sync_idx'),
+        ]
+
+    def __str__(self):
+        return self.jti
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.id})'
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    # Expected length of the chunk at the given index; the last one may be short
+    def chunk_length(self, index):
+        if index == self.total_chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk'),
+        ]
+
+    def __str__(self):
+        return f'{self.session_id} #{self.index}'
+
+class EmailOutbox(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to_email = models.EmailField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.to_email} ({self.status})'
@@ -1,13 +1,46 @@
 from rest_framework import renderers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.utils.encoders import JSONEncoder
 import json
 
+# orjson is optional; it is used when installed and json is the fallback
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+_encoder = JSONEncoder()
+
+# Walk the payload looking for ErrorDetail values (what DRF validation errors are made of)
+def contains_error_detail(data):
+  stack = [data]
+  while stack:
+    item = stack.pop()
+    if isinstance(item, ErrorDetail):
+      return True
+    if isinstance(item, dict):
+      stack.extend(item.values())
+    elif isinstance(item, (list, tuple)):
+      stack.extend(item)
+  return False
+
+# Serialize once, straight to UTF-8 bytes
+def dumps(data):
+  if orjson is not None:
+    try:
+      return orjson.dumps(data, default=_encoder.default)
+    except TypeError:
+      pass
+  return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 class UserRenderer(renderers.JSONRenderer):
   charset='utf-8'
   def render(self, data, accepted_media_type=None, renderer_context=None):
-    response = ''
-    if 'ErrorDetail' in str(data):
-      response = json.dumps({'errors':data})
-    else:
-      response = json.dumps(data)
-    
-    return response
\ No newline at end of file
+    if data is None:
+      return b''
+
+    # Only error responses are inspected, and by type rather than by repr()
+    response = (renderer_context or {}).get('response')
+    if (response is None or response.status_code >= 400) and contains_error_detail(data):
+      data = {'errors': data}
+    return dumps(data)
@@ -0,0 +1,89 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from account.models import RevokedToken
+
+# Every process keeps the unexpired jtis revoked by logout in memory and
+# refreshes them from the RevokedToken table at most every
+# REVOKED_TOKEN_SYNC_INTERVAL seconds, so checking a token that was never
+# revoked costs no query. Revocations made by this process apply at once; ones
+# made elsewhere are picked up on the next sync. Refresh tokens used up by
+# rotation stay out of the list, which so grows with logouts rather than with
+# refresh traffic; their unique row is what makes them single use.
+REVOKED_TOKEN_SYNC_INTERVAL = getattr(settings, 'REVOKED_TOKEN_SYNC_INTERVAL', 5)
+
+# Each sync re-reads this much history, so rows committed slightly out of
+# order by concurrent transactions are not missed
+SYNC_OVERLAP = timedelta(minutes=1)
+
+class RevocationList:
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+        self.entries = {}
+        self.synced_at = None
+        self.next_sync = 0
+        self.lock = threading.Lock()
+
+    def sync(self):
+        if time.monotonic() < self.next_sync:
+            return
+        with self.lock:
+            if time.monotonic() < self.next_sync:
+                return
+            started = timezone.now()
+            rows = RevokedToken.objects.filter(reason=RevokedToken.REASON_LOGOUT, expires_at__gt=started)
+            if self.synced_at is not None:
+                rows = rows.filter(revoked_at__gte=self.synced_at - SYNC_OVERLAP)
+            for jti, expires_at in rows.values_list('jti', 'expires_at'):
+                self.entries[jti] = expires_at.timestamp()
+            # Expired tokens are rejected on their own, so drop them here
+            now = time.time()
+            self.entries = {jti: expires for jti, expires in self.entries.items() if expires > now}
+            self.synced_at = started
+            self.next_sync = time.monotonic() + self.sync_interval
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.entries[jti] = expires_at.timestamp()
+
+    def __contains__(self, jti):
+        self.sync()
+        return jti in self.entries
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.synced_at = None
+            self.next_sync = 0
+
+revocation_list = RevocationList(REVOKED_TOKEN_SYNC_INTERVAL)
+
+def token_expiry(token):
+    return datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+
+def is_revoked(token):
+    return token.get(api_settings.JTI_CLAIM) in revocation_list
+
+# Whether a refresh token was used up by rotation; one indexed lookup
+def is_rotated(token):
+    return RevokedToken.objects.filter(jti=token.get(api_settings.JTI_CLAIM), reason=RevokedToken.REASON_ROTATED).exists()
+
+# Record a token as revoked. Returns False when it already was, which makes
+# revoking usable as an atomic "use once" check for refresh rotation.
+def revoke_token(token, reason=RevokedToken.REASON_LOGOUT):
+    jti = token[api_settings.JTI_CLAIM]
+    expires_at = token_expiry(token)
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, reason=reason, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    if reason == RevokedToken.REASON_LOGOUT:
+        revocation_list.add(jti, expires_at)
+    return True
@@ -1,10 +1,16 @@
 from rest_framework import serializers
-from account.models import User, File
+from account.models import User, File, UploadSession, RevokedToken
+from account.uploads import UPLOAD_CHUNK_SIZE, UPLOAD_MIN_CHUNK_SIZE, UPLOAD_MAX_CHUNK_SIZE, UPLOAD_MAX_FILE_SIZE
 from django.utils.encoding import smart_str, force_bytes, DjangoUnicodeDecodeError
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from account.utils import Util
 from django.contrib.auth import authenticate
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+from account.revocation import is_revoked, is_rotated, revoke_token
 
 # Serializer for user registration
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -25,13 +31,10 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Password and Confirm Password do not match")
         return attrs
 
-    # Create a new user and set the password
+    # Create a new user; create_user hashes the password and inserts the row once
     def create(self, validated_data):
-        password = validated_data.pop('password2')
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
-        return user
+        validated_data.pop('password2')
+        return User.objects.create_user(**validated_data)
 
 # Serializer for user login
 class UserLoginSerializer(serializers.Serializer):
@@ -62,8 +65,48 @@ class FileUploadSerializer(serializers.ModelSerializer):
 class FileListSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
-        fields = ['id', 'file', 'name', 'uploaded_at']
-        read_only_fields = ['user', 'uploaded_at']
+        fields = ['id', 'file', 'name', 'uploaded_at', 'size', 'content_type', 'checksum']
+        read_only_fields = ['user', 'uploaded_at', 'size', 'content_type', 'checksum']
+
+# Serializer for one rename inside a batch request
+class FileRenameItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    name = serializers.CharField(max_length=255)
+
+# Serializer for batch file operations
+class FileBatchSerializer(serializers.Serializer):
+    MAX_ITEMS = 500
+
+    delete = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    rename = FileRenameItemSerializer(many=True, required=False, default=list)
+    fetch = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+
+    # Validate the batch size and that no file is both renamed and deleted
+    def validate(self, attrs):
+        total = len(attrs['delete']) + len(attrs['rename']) + len(attrs['fetch'])
+        if total == 0:
+            raise serializers.ValidationError('No operations given')
+        if total > self.MAX_ITEMS:
+            raise serializers.ValidationError(f'A batch may contain at most {self.MAX_ITEMS} operations')
+        if set(attrs['delete']) & {item['id'] for item in attrs['rename']}:
+            raise serializers.ValidationError('A file cannot be renamed and deleted in the same batch')
+        return attrs
+
+# Serializer for opening and inspecting chunked upload sessions
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.IntegerField(min_value=UPLOAD_MIN_CHUNK_SIZE, max_value=UPLOAD_MAX_CHUNK_SIZE, default=UPLOAD_CHUNK_SIZE)
+    size = serializers.IntegerField(min_value=1, max_value=UPLOAD_MAX_FILE_SIZE)
+    total_chunks = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'name', 'size', 'chunk_size', 'total_chunks', 'received_chunks', 'expires_at']
+        read_only_fields = ['id', 'expires_at']
+
+    # Indexes of the chunks that have arrived so far
+    def get_received_chunks(self, obj):
+        return sorted(obj.chunks.values_list('index', flat=True))
 
 # Serializer for user profile
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -86,8 +129,10 @@ class UserChangePasswordSerializer(serializers.Serializer):
         user = self.context.get('user')
         if password != password2:
             raise serializers.ValidationError("Password and Confirm Password doesn't match")
+        # user may be the cached request.user, so only the password is written;
+        # a full save would restore stale counters such as no_of_files_uploaded
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password', 'updated_at'])
         return attrs
 
 # Serializer for sending password reset email
@@ -100,20 +145,20 @@ class SendPasswordResetEmailSerializer(serializers.Serializer):
     # Validate the email and send password reset link if the user exists
     def validate(self, attrs):
         email = attrs.get('email')
-        if User.objects.filter(email=email).exists():
-            user = User.objects.get(email=email)
+        user = User.objects.filter(email=email).first()
+        if user is not None:
             uid = urlsafe_base64_encode(force_bytes(user.id))
             token = PasswordResetTokenGenerator().make_token(user)
             link = 'http://localhost:3000/api/user/reset/' + uid + '/' + token
 
-            # Send email with the reset link
+            # Queue the email with the reset link; a worker sends it outside the request
             body = 'Click Following Link to Reset Your Password ' + link
             data = {
                 'subject': 'Reset Your Password',
                 'body': body,
                 'to_email': user.email
             }
-            Util.send_email(data)
+            Util.queue_email(data)
             return attrs
         else:
             raise serializers.ValidationError('You are not a Registered User')
@@ -140,8 +185,46 @@ class UserPasswordResetSerializer(serializers.Serializer):
             if not PasswordResetTokenGenerator().check_token(user, token):
                 raise serializers.ValidationError('Token is not Valid or Expired')
             user.set_password(password)
-            user.save()
+            user.save(update_fields=['password', 'updated_at'])
             return attrs
         except DjangoUnicodeDecodeError as identifier:
             PasswordResetTokenGenerator().check_token(user, token)
             raise serializers.ValidationError('Token is not Valid or Expired')
+
+# Refresh that rejects revoked tokens. With ROTATE_REFRESH_TOKENS each refresh
+# token is single use: it is revoked as the new pair is issued, and a second
+# (or concurrent) attempt with it fails.
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if not revoke_token(refresh, RevokedToken.REASON_ROTATED):
+                raise TokenError('Token is revoked')
+        elif is_revoked(refresh):
+            raise TokenError('Token is revoked')
+        return super().validate(attrs)
+
+# Rotated refresh tokens are not in the in-memory list, so verifying a
+# refresh token also looks it up; access tokens are checked without a query
+class TokenVerifySerializer(jwt_serializers.TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        if is_revoked(token):
+            raise TokenError('Token is revoked')
+        if token.get(jwt_settings.TOKEN_TYPE_CLAIM) == 'refresh' and is_rotated(token):
+            raise TokenError('Token is revoked')
+        return {}
+
+# Serializer for logging out: the refresh token must belong to the caller
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        try:
+            refresh = RefreshToken(attrs['refresh'])
+        except TokenError as e:
+            raise serializers.ValidationError(e.args[0])
+        if str(refresh.get(jwt_settings.USER_ID_CLAIM)) != str(self.context['user'].pk):
+            raise serializers.ValidationError('Token does not belong to this user')
+        attrs['token'] = refresh
+        return attrs
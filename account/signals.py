@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from account.cache import invalidate_cached_profile, invalidate_cached_user
+from account.models import File, User
+from account.storage import release_blob, schedule_deletion
+
+# Any change to a user row (password, is_active, ...) evicts the cached copy
+# and the cached profile body
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+    invalidate_cached_profile(instance.pk)
+
+# Set while a caller deletes many files and releases their content itself
+_content_release_deferred = ContextVar('content_release_deferred', default=False)
+
+@contextmanager
+def deferred_content_release():
+    token = _content_release_deferred.set(True)
+    try:
+        yield
+    finally:
+        _content_release_deferred.reset(token)
+
+# Deleting a File (directly, in bulk or by cascade from its user) drops its
+# blob reference, or queues its own bytes for the garbage collector
+@receiver(post_delete, sender=File)
+def release_file_content(sender, instance, **kwargs):
+    if _content_release_deferred.get():
+        return
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file.name:
+        schedule_deletion([instance.file.name])
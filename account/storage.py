@@ -0,0 +1,131 @@
+import hashlib
+import mimetypes
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from account.compression import ENCODING_SUFFIXES
+from account.models import Blob, File, StorageTombstone
+
+# Store each distinct upload once under its SHA-256 and let File rows share it
+FILE_DEDUPLICATION = getattr(settings, 'FILE_DEDUPLICATION', True)
+
+def blob_storage():
+    return Blob._meta.get_field('file').storage
+
+# blobs/ab/cd/abcd... keeps directories small however many blobs exist;
+# compressed blobs get a suffix (abcd....gz)
+def blob_name(digest, encoding=''):
+    return f'blobs/{digest[:2]}/{digest[2:4]}/{digest}{ENCODING_SUFFIXES.get(encoding, "")}'
+
+# Encoding and on-disk size of an upload; only streamed uploads are compressed
+def stored_encoding(content, size):
+    return getattr(content, 'content_encoding', ''), getattr(content, 'stored_size', size)
+
+# SHA-256 and size of an uploaded file. Producers that already hashed the
+# bytes while receiving them attach sha256/size so we don't read them again.
+def hash_content(content):
+    digest = getattr(content, 'sha256', None)
+    if digest is not None:
+        return digest, content.size
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        sha256.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    return sha256.hexdigest(), size
+
+# Take a reference to an existing blob, returning None if there is none yet
+def _acquire_existing(digest):
+    if Blob.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1):
+        return Blob.objects.get(digest=digest)
+    return None
+
+# Return the Blob for this content with one more reference, writing the bytes
+# to storage only if no blob with the same digest exists yet
+def store_blob(content):
+    digest, size = hash_content(content)
+    blob = _acquire_existing(digest)
+    if blob is not None:
+        return blob
+
+    encoding, stored_size = stored_encoding(content, size)
+    name = blob_name(digest, encoding)
+    storage = blob_storage()
+    try:
+        with transaction.atomic():
+            # The bytes may have been queued for collection when an earlier blob
+            # with this digest died; they are live again now. The delete waits
+            # for a collector holding the tombstone, so the check below sees
+            # whether it removed the bytes in the meantime.
+            StorageTombstone.objects.filter(name=name).delete()
+            if not storage.exists(name):
+                saved = storage.save(name, content)
+                if saved != name:
+                    # Another request wrote the same content first; its copy is identical
+                    storage.delete(saved)
+            return Blob.objects.create(digest=digest, file=name, size=size, encoding=encoding, stored_size=stored_size, ref_count=1)
+    except IntegrityError:
+        return _acquire_existing(digest)
+
+# Drop references to several blobs at once ({blob_id: count}) with one UPDATE.
+# Blobs left unreferenced lose their row now and their bytes after commit.
+def release_blobs(counts):
+    if not counts:
+        return
+    decrement = Case(*[When(pk=pk, then=Value(count)) for pk, count in counts.items()], output_field=PositiveIntegerField())
+    with transaction.atomic():
+        # The UPDATE also locks these rows until commit, so no reference can be taken in between
+        Blob.objects.filter(pk__in=counts).update(ref_count=F('ref_count') - decrement)
+        unreferenced = list(Blob.objects.filter(pk__in=counts, ref_count=0).values_list('pk', 'file'))
+        if unreferenced:
+            Blob.objects.filter(pk__in=[pk for pk, _ in unreferenced]).delete()
+            schedule_deletion([name for _, name in unreferenced])
+
+def release_blob(blob_id):
+    release_blobs({blob_id: 1})
+
+# Record stored names for the garbage collector instead of deleting them inline,
+# so a rolled-back transaction never leaves rows pointing at missing bytes
+def schedule_deletion(names):
+    StorageTombstone.objects.bulk_create([StorageTombstone(name=name) for name in names])
+
+# Content type for a display name, falling back to what the client declared
+def guess_content_type(name, declared=None):
+    mime_type, _ = mimetypes.guess_type(name)
+    return mime_type or declared or 'application/octet-stream'
+
+# Store an upload's bytes on a File and record its size, type and checksum so
+# later reads never need to stat or re-read the stored file
+def _attach_content(file_instance, content):
+    if FILE_DEDUPLICATION:
+        blob = store_blob(content)
+        file_instance.file.name = blob.file.name
+        file_instance.blob = blob
+        file_instance.size, file_instance.checksum = blob.size, blob.digest
+        file_instance.encoding, file_instance.stored_size = blob.encoding, blob.stored_size or blob.size
+    else:
+        file_instance.checksum, file_instance.size = hash_content(content)
+        file_instance.encoding, file_instance.stored_size = stored_encoding(content, file_instance.size)
+        file_instance.file.save(content.name, content, save=False)
+        file_instance.blob = None
+    file_instance.content_type = guess_content_type(file_instance.name, getattr(content, 'content_type', None))
+
+# Build an unsaved File for an upload, deduplicated when enabled
+def build_file(content, name, user):
+    file_instance = File(name=name, user=user)
+    _attach_content(file_instance, content)
+    return file_instance
+
+# Point an existing File at new content and save it, releasing whatever it
+# stored before. Call inside a transaction.
+def replace_file_content(file_instance, content):
+    old_blob_id = file_instance.blob_id
+    if not old_blob_id:
+        schedule_deletion([file_instance.file.name])
+    _attach_content(file_instance, content)
+    file_instance.save()
+    if old_blob_id:
+        release_blob(old_blob_id)
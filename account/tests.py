@@ -1,3 +1,996 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from account.models import Blob, File, User, UploadSession, UploadChunk, EmailOutbox, StorageTombstone, RevokedToken
+from account.cache import file_list_stats, profile_stats, user_cache
+from account.hashing import ConfigurablePBKDF2PasswordHasher, HashingQueueFull
+from account.metrics import render_metrics
+from account.renderers import UserRenderer
+from account.revocation import is_revoked, revocation_list
+from account.storage import blob_storage, build_file, hash_content
+from account.uploads import incoming_dir
+from account.views import get_tokens_for_user
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# File list caching needs a cache every worker shares; locmem turns it off
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(MEDIA_ROOT, 'cache'),
+    },
+}
+
+
+def create_user(email='user@example.com', password='secret-pass-123'):
+    return User.objects.create_user(
+        email=email, first_name='Test', last_name='User', address='Somewhere',
+        phone='0000000', age=30, password=password,
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FileTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_file(self, content=b'hello world', name='hello.txt', user=None):
+        return File.objects.create(file=SimpleUploadedFile(name, content), name=name, user=user or self.user)
+
+
+class FileViewTests(FileTestCase):
+    def test_download_is_streamed(self):
+        file_instance = self.create_file(b'x' * 200000, name='big.bin')
+        response = self.client.get(reverse('file-view', args=[file_instance.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], '200000')
+        self.assertIn('filename="big.bin"', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 200000)
+        response.close()
+
+    def test_other_users_file_is_not_found(self):
+        file_instance = self.create_file(user=create_user('other@example.com'))
+        response = self.client.get(reverse('file-view', args=[file_instance.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_single_range(self):
+        file_instance = self.create_file(b'0123456789')
+        response = self.client.get(reverse('file-view', args=[file_instance.id]), HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        response.close()
+
+    def test_multiple_ranges(self):
+        file_instance = self.create_file(b'0123456789')
+        response = self.client.get(reverse('file-view', args=[file_instance.id]), HTTP_RANGE='bytes=0-1,-2')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', body)
+        self.assertIn(b'Content-Range: bytes 8-9/10\r\n\r\n89\r\n', body)
+
+    def test_unsatisfiable_range(self):
+        file_instance = self.create_file(b'0123456789')
+        response = self.client.get(reverse('file-view', args=[file_instance.id]), HTTP_RANGE='bytes=20-30')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_none_match_returns_not_modified(self):
+        file_instance = self.create_file()
+        url = reverse('file-view', args=[file_instance.id])
+        response = self.client.get(url)
+        response.close()
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_stale_if_range_returns_full_body(self):
+        file_instance = self.create_file(b'0123456789')
+        response = self.client.get(
+            reverse('file-view', args=[file_instance.id]), HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        response.close()
+
+
+class UploadSessionTests(FileTestCase):
+    def put_chunk(self, session_id, index, data, checksum=None):
+        return self.client.generic(
+            'PUT', reverse('upload-chunk', args=[session_id, index]), data,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_CHECKSUM=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def test_chunks_in_any_order_are_assembled(self):
+        chunk_size = 256 * 1024
+        content = os.urandom(chunk_size * 2 + 100)
+        response = self.client.post(reverse('upload-session-create'), {'name': 'big.bin', 'size': len(content), 'chunk_size': chunk_size})
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data['id']
+        self.assertEqual(response.data['total_chunks'], 3)
+
+        for index in (2, 0):
+            self.assertEqual(self.put_chunk(session_id, index, content[index * chunk_size:(index + 1) * chunk_size]).status_code, 200)
+        response = self.client.post(reverse('upload-session-complete', args=[session_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['missing_chunks'], [1])
+
+        self.assertEqual(self.put_chunk(session_id, 1, content[chunk_size:2 * chunk_size]).status_code, 200)
+        self.assertEqual(self.client.get(reverse('upload-session', args=[session_id])).data['received_chunks'], [0, 1, 2])
+        response = self.client.post(reverse('upload-session-complete', args=[session_id]))
+        self.assertEqual(response.status_code, 201)
+
+        file_instance = File.objects.get(id=response.data['id'])
+        with file_instance.file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_checksum_mismatch_is_rejected(self):
+        response = self.client.post(reverse('upload-session-create'), {'name': 'a.txt', 'size': 5})
+        response = self.put_chunk(response.data['id'], 0, b'hello', checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadChunk.objects.exists())
+
+    @override_settings(MAX_FILES_PER_USER=1)
+    def test_quota_is_claimed_before_assembling(self):
+        User.objects.claim_file_slots(self.user.pk, 1)
+        session_id = self.client.post(reverse('upload-session-create'), {'name': 'a.txt', 'size': 5}).data['id']
+        self.put_chunk(session_id, 0, b'hello')
+        with mock.patch('account.views.assemble_chunks') as assemble:
+            response = self.client.post(reverse('upload-session-complete', args=[session_id]))
+        self.assertEqual(response.status_code, 400)
+        assemble.assert_not_called()
+        self.assertTrue(UploadSession.objects.filter(id=session_id).exists())
+
+    def test_session_size_is_capped(self):
+        response = self.client.post(reverse('upload-session-create'), {'name': 'huge.bin', 'size': 2 ** 60})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class FileUploadTests(FileTestCase):
+    def test_upload_inserts_rows_and_counts_them(self):
+        files = [SimpleUploadedFile(f'{i}.txt', b'data') for i in range(3)]
+        response = self.client.post(reverse('file-upload'), {'file': files}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(File.objects.filter(user=self.user).count(), 3)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.no_of_files_uploaded, 3)
+
+    @override_settings(MAX_FILES_PER_USER=2)
+    def test_upload_over_quota_is_rejected(self):
+        files = [SimpleUploadedFile(f'{i}.txt', b'data') for i in range(3)]
+        response = self.client.post(reverse('file-upload'), {'file': files}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(File.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.no_of_files_uploaded, 0)
+
+    def test_upload_is_streamed_once_and_hashed(self):
+        with mock.patch('django.core.files.uploadhandler.TemporaryFileUploadHandler.new_file') as spooled, \
+                mock.patch('account.storage.hash_content', wraps=hash_content) as hashed:
+            response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.txt', b'streamed')]}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        spooled.assert_not_called()
+        self.assertTrue(hasattr(hashed.call_args.args[0], 'sha256'))
+        file_instance = File.objects.get()
+        self.assertEqual(file_instance.checksum, hashlib.sha256(b'streamed').hexdigest())
+        with file_instance.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'streamed')
+        self.assertEqual(os.listdir(incoming_dir()), [])
+
+    def test_oversize_request_is_rejected_from_content_length(self):
+        with mock.patch('account.views.UPLOAD_MAX_REQUEST_SIZE', 10):
+            response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.txt', b'x' * 100)]}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(File.objects.exists())
+
+    def test_oversize_file_is_rejected_while_streaming(self):
+        with mock.patch('account.uploads.UPLOAD_MAX_FILE_SIZE', 10):
+            response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.txt', b'x' * 100)]}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(os.listdir(incoming_dir()), [])
+
+    def test_disallowed_type_is_rejected(self):
+        with mock.patch('account.uploads.UPLOAD_ALLOWED_TYPES', ['image/*']):
+            response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.txt', b'text')]}, format='multipart')
+            self.assertEqual(response.status_code, 415)
+            response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.png', b'png')]}, format='multipart')
+            self.assertEqual(response.status_code, 201)
+
+    def test_replacements_and_sessions_are_held_to_the_same_limits(self):
+        file_instance = self.create_file(name='a.png')
+        with mock.patch('account.uploads.UPLOAD_ALLOWED_TYPES', ['image/*']):
+            response = self.client.put(
+                reverse('file-update', args=[file_instance.id]),
+                {'name': 'a.exe', 'file': SimpleUploadedFile('a.exe', b'MZ')}, format='multipart',
+            )
+            self.assertEqual(response.status_code, 415)
+            response = self.client.post(reverse('upload-session-create'), {'name': 'a.exe', 'size': 5})
+            self.assertEqual(response.status_code, 415)
+        with mock.patch('account.uploads.UPLOAD_MAX_FILE_SIZE', 10):
+            response = self.client.put(
+                reverse('file-update', args=[file_instance.id]),
+                {'file': SimpleUploadedFile('b.png', b'x' * 100)}, format='multipart',
+            )
+            self.assertEqual(response.status_code, 413)
+        stored_name = file_instance.file.name
+        file_instance.refresh_from_db()
+        self.assertEqual((file_instance.name, file_instance.file.name), ('a.png', stored_name))
+        self.assertFalse(UploadSession.objects.exists())
+
+    @override_settings(MAX_FILES_PER_USER=1)
+    def test_full_quota_is_rejected_before_reading_body(self):
+        User.objects.claim_file_slots(self.user.pk, 1)
+        self.user.refresh_from_db()
+        with mock.patch('account.uploads.StreamingUploadHandler.new_file') as new_file:
+            response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.txt', b'data')]}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        new_file.assert_not_called()
+
+    @override_settings(MAX_FILES_PER_USER=1)
+    def test_quota_is_read_from_the_database_not_the_cached_user(self):
+        # request.user still counts a file another worker has since deleted
+        self.user.no_of_files_uploaded = 1
+        response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('a.txt', b'data')]}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+
+# Runs against whichever database is configured, so point DATABASES at
+# PostgreSQL (POSTGRES_DB=...) to exercise real row-level concurrency.
+@override_settings(MAX_FILES_PER_USER=20)
+class UploadQuotaConcurrencyTests(TransactionTestCase):
+    def test_concurrent_claims_never_exceed_quota(self):
+        user = create_user()
+        granted = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            try:
+                for _ in range(10):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                if User.objects.claim_file_slots(user.pk, 1):
+                                    granted.append(1)
+                            break
+                        except OperationalError:
+                            # SQLite reports lock contention instead of waiting; retry like a client would
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        user.refresh_from_db()
+        self.assertEqual(len(granted), 20)
+        self.assertEqual(user.no_of_files_uploaded, 20)
+
+
+class FileListTests(FileTestCase):
+    def test_cursor_pages_are_stable_and_uncounted(self):
+        created = [self.create_file(name=f'{i}.txt').id for i in range(20)]
+        response = self.client.get(reverse('file-list'))
+        self.assertNotIn('count', response.data)
+        ids = [item['id'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, created)
+        self.assertIsNone(response.data['next'])
+
+    def test_page_number_mode_is_opt_in(self):
+        for i in range(3):
+            self.create_file(name=f'{i}.txt')
+        response = self.client.get(reverse('file-list'), {'page': 1})
+        self.assertEqual(response.data['count'], 3)
+
+
+class PasswordResetEmailTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_reset_email_is_queued_then_sent_by_worker(self):
+        create_user()
+        response = APIClient().post(reverse('send-reset-password-email'), {'email': 'user@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.STATUS_PENDING)
+
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        message = EmailOutbox.objects.get()
+        self.assertEqual(message.status, EmailOutbox.STATUS_SENT)
+        self.assertIsNotNone(message.sent_at)
+
+    def test_failed_delivery_is_retried_later(self):
+        message = EmailOutbox.objects.create(subject='s', body='b', to_email='user@example.com')
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('down')):
+            call_command('send_queued_emails', stdout=StringIO())
+        message.refresh_from_db()
+        self.assertEqual(message.status, EmailOutbox.STATUS_PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(message.last_error, 'down')
+
+    def test_connection_is_reopened_after_a_failed_send(self):
+        for index in range(3):
+            EmailOutbox.objects.create(subject=f's{index}', body='b', to_email='user@example.com')
+        connection_lost = [OSError('connection lost')]
+
+        def send(email):
+            if connection_lost:
+                raise connection_lost.pop()
+            return 1
+
+        with mock.patch('django.core.mail.EmailMessage.send', autospec=True, side_effect=send), \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(open_connection.call_count, 2)
+        statuses = list(EmailOutbox.objects.order_by('id').values_list('status', flat=True))
+        self.assertEqual(statuses, [EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_SENT])
+
+
+class UserRendererTests(TestCase):
+    def render(self, data, status):
+        return json.loads(UserRenderer().render(data, renderer_context={'response': Response(data, status=status)}))
+
+    def test_validation_errors_are_wrapped(self):
+        errors = {'email': [ErrorDetail('This field is required.', code='required')]}
+        self.assertEqual(self.render(errors, 400), {'errors': {'email': ['This field is required.']}})
+
+    def test_content_mentioning_error_detail_is_not_wrapped(self):
+        data = {'first_name': 'ErrorDetail'}
+        self.assertEqual(self.render(data, 200), data)
+
+    def test_json_fallback_without_orjson(self):
+        with mock.patch('account.renderers.orjson', None):
+            self.assertEqual(self.render({'name': 'é'}, 200), {'name': 'é'})
+
+
+REGISTRATION = {
+    'email': 'new@example.com', 'first_name': 'New', 'last_name': 'User', 'address': 'Somewhere',
+    'phone': '0000000', 'age': 30, 'password': 'secret-pass-123', 'password2': 'secret-pass-123',
+}
+
+
+class RegistrationAndLoginTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_registration_hashes_once_and_inserts_once(self):
+        with mock.patch.object(ConfigurablePBKDF2PasswordHasher, 'encode', autospec=True,
+                               side_effect=ConfigurablePBKDF2PasswordHasher.encode) as encode:
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().post(reverse('register'), REGISTRATION)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(encode.call_count, 1)
+        writes = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+
+
+# The hashing pool runs on its own threads and database connections
+class AsyncRegistrationAndLoginTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_async_registration_and_login(self):
+        response = self.client.post(reverse('async-register'), REGISTRATION, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(
+            reverse('async-login'), {'email': 'new@example.com', 'password': 'secret-pass-123'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json()['token'])
+
+    def test_async_login_rejects_bad_credentials(self):
+        response = self.client.post(
+            reverse('async-login'), {'email': 'nobody@example.com', 'password': 'x'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.json())
+
+    def test_async_login_sheds_load_when_pool_is_full(self):
+        with mock.patch('account.views.run_in_hashing_pool', side_effect=HashingQueueFull):
+            response = self.client.post(
+                reverse('async-login'), {'email': 'new@example.com', 'password': 'x'}, content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedJWTAuthenticationTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        # Sync now so the revocation list doesn't query inside assertNumQueries
+        revocation_list.clear()
+        revocation_list.sync()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_user_lookup_is_cached_between_requests(self):
+        self.create_file()
+        with self.assertNumQueries(2):
+            self.client.get(reverse('file-list'))
+        # The listing itself is cached too, so the repeat request needs no queries at all
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('file-list'))
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_deactivating_user_evicts_cache(self):
+        self.client.get(reverse('file-list'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('file-list')).status_code, 401)
+
+    def test_password_change_keeps_counters_updated_elsewhere(self):
+        self.client.get(reverse('file-list'))
+        # Another worker claims slots while this process still holds the cached user
+        User.objects.filter(pk=self.user.pk).update(no_of_files_uploaded=5)
+        response = self.client.post(reverse('changepassword'), {'password': 'new-pass-456', 'password2': 'new-pass-456'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.no_of_files_uploaded, 5)
+        self.assertTrue(self.user.check_password('new-pass-456'))
+
+
+class DeduplicationTests(FileTestCase):
+    def upload(self, content, name):
+        response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile(name, content)]}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(user=self.user, name=name)
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(b'same bytes', 'a.txt')
+        second = self.upload(b'same bytes', 'b.txt')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+
+        self.client.delete(reverse('file-delete', args=[first.id]))
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(blob_storage().exists(blob.file.name))
+
+        self.client.delete(reverse('file-delete', args=[second.id]))
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(blob_storage().exists(blob.file.name))
+        call_command('collect_garbage', grace_seconds=0, stdout=StringIO())
+        self.assertFalse(blob_storage().exists(blob.file.name))
+
+    def test_dedupe_command_links_existing_files(self):
+        legacy = [self.create_file(b'legacy', name=f'{i}.txt') for i in range(3)]
+        call_command('dedupe_files', stdout=StringIO())
+        call_command('collect_garbage', grace_seconds=0, stdout=StringIO())
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        for file_instance in legacy:
+            self.assertFalse(blob_storage().exists(file_instance.file.name))
+            file_instance.refresh_from_db()
+            self.assertEqual(file_instance.blob_id, blob.id)
+        with blob.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'legacy')
+
+
+class ShardedLayoutTests(FileTestCase):
+    def test_new_files_are_sharded(self):
+        file_instance = self.create_file()
+        self.assertRegex(file_instance.file.name, r'^uploads/[0-9a-f]{2}/[0-9a-f]{2}/hello\.txt$')
+
+    def test_shard_command_moves_flat_files(self):
+        storage = File._meta.get_field('file').storage
+        flat_name = storage.save('uploads/flat.txt', SimpleUploadedFile('flat.txt', b'flat'))
+        file_instance = File.objects.create(file=flat_name, name='flat.txt', user=self.user)
+        call_command('shard_uploads', stdout=StringIO())
+        file_instance.refresh_from_db()
+        self.assertRegex(file_instance.file.name, r'^uploads/[0-9a-f]{2}/[0-9a-f]{2}/flat')
+        self.assertFalse(storage.exists(flat_name))
+        with file_instance.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'flat')
+
+
+class FileRenameTests(FileTestCase):
+    def test_rename_is_metadata_only(self):
+        file_instance = self.create_file()
+        storage_key = file_instance.file.name
+        patches = [mock.patch.object(FileSystemStorage, method) for method in ('open', 'save', 'delete', 'exists', 'path', 'size')]
+        mocks = [patch.start() for patch in patches]
+        try:
+            with self.assertNumQueries(2):
+                response = self.client.put(reverse('file-update', args=[file_instance.id]), {'name': 'renamed.txt'})
+        finally:
+            for patch in patches:
+                patch.stop()
+        self.assertEqual(response.status_code, 200)
+        for storage_mock in mocks:
+            storage_mock.assert_not_called()
+
+        file_instance.refresh_from_db()
+        self.assertEqual(file_instance.name, 'renamed.txt')
+        self.assertEqual(file_instance.file.name, storage_key)
+        response = self.client.get(reverse('file-view', args=[file_instance.id]))
+        self.assertIn('filename="renamed.txt"', response['Content-Disposition'])
+        response.close()
+
+
+class FileBatchTests(FileTestCase):
+    def test_batch_delete_rename_and_fetch(self):
+        response = self.client.post(
+            reverse('file-upload'),
+            {'file': [SimpleUploadedFile(f'{i}.txt', b'shared' if i < 2 else b'own') for i in range(3)]},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        first, second, third = File.objects.filter(user=self.user).order_by('id')
+        foreign = self.create_file(user=create_user('other@example.com'))
+
+        response = self.client.post(reverse('file-batch'), {
+            'delete': [first.id, second.id, foreign.id],
+            'rename': [{'id': third.id, 'name': 'renamed.txt'}],
+            'fetch': [third.id, 999999],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        statuses = [(item['id'], item['op'], item['status']) for item in response.data['results']]
+        self.assertEqual(statuses, [
+            (first.id, 'delete', 'deleted'), (second.id, 'delete', 'deleted'), (foreign.id, 'delete', 'not_found'),
+            (third.id, 'rename', 'ok'), (third.id, 'fetch', 'ok'), (999999, 'fetch', 'not_found'),
+        ])
+        self.assertEqual(response.data['results'][4]['file']['name'], 'renamed.txt')
+
+        self.assertEqual(list(File.objects.filter(user=self.user).values_list('id', flat=True)), [third.id])
+        self.assertTrue(File.objects.filter(id=foreign.id).exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.no_of_files_uploaded, 1)
+        self.assertEqual(list(Blob.objects.values_list('id', flat=True)), [third.blob_id])
+        self.assertEqual(list(StorageTombstone.objects.values_list('name', flat=True)), [first.file.name])
+
+    def test_rename_and_delete_of_same_file_is_rejected(self):
+        file_instance = self.create_file()
+        response = self.client.post(reverse('file-batch'), {
+            'delete': [file_instance.id], 'rename': [{'id': file_instance.id, 'name': 'x'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class GarbageCollectionTests(FileTestCase):
+    def test_delete_only_buries_bytes_until_collected(self):
+        file_instance = self.create_file()
+        name = file_instance.file.name
+        self.client.delete(reverse('file-delete', args=[file_instance.id]))
+        self.assertTrue(file_instance.file.storage.exists(name))
+        call_command('collect_garbage', grace_seconds=0, stdout=StringIO())
+        self.assertFalse(file_instance.file.storage.exists(name))
+        self.assertFalse(StorageTombstone.objects.exists())
+
+    def test_collector_keeps_names_that_are_referenced_again(self):
+        file_instance = self.create_file()
+        StorageTombstone.objects.create(name=file_instance.file.name)
+        call_command('collect_garbage', grace_seconds=0, stdout=StringIO())
+        self.assertTrue(file_instance.file.storage.exists(file_instance.file.name))
+
+    def test_orphan_scan_queues_unreferenced_files(self):
+        kept = self.create_file()
+        storage = kept.file.storage
+        orphan = storage.save('uploads/orphan.txt', SimpleUploadedFile('orphan.txt', b'orphan'))
+        call_command('scan_orphans', min_age=-60, stdout=StringIO())
+        queued = set(StorageTombstone.objects.values_list('name', flat=True))
+        self.assertIn(orphan, queued)
+        self.assertNotIn(kept.file.name, queued)
+
+
+class FileArchiveTests(FileTestCase):
+    def test_archive_streams_selected_files(self):
+        first = self.create_file(b'first', name='same.txt')
+        second = self.create_file(b'second' * 1000, name='same.txt')
+        self.create_file(b'skipped', name='other.txt')
+        response = self.client.get(reverse('file-archive'), {'ids': f'{first.id},{second.id}', 'compression': 'deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            self.assertEqual(archive.namelist(), ['same.txt', 'same (1).txt'])
+            self.assertEqual(archive.read('same.txt'), b'first')
+            self.assertEqual(archive.read('same (1).txt'), b'second' * 1000)
+            self.assertEqual(archive.getinfo('same (1).txt').compress_type, zipfile.ZIP_DEFLATED)
+
+
+class FileMetadataTests(FileTestCase):
+    def test_upload_records_metadata_and_download_skips_stat(self):
+        content = b'{"a": 1}'
+        self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('data.json', content)]}, format='multipart')
+        file_instance = File.objects.get(user=self.user)
+        self.assertEqual(file_instance.size, len(content))
+        self.assertEqual(file_instance.content_type, 'application/json')
+        self.assertEqual(file_instance.checksum, hashlib.sha256(content).hexdigest())
+
+        listed = self.client.get(reverse('file-list')).data['results'][0]
+        self.assertEqual((listed['size'], listed['content_type']), (len(content), 'application/json'))
+
+        with mock.patch.object(FileSystemStorage, 'size') as size, mock.patch.object(FileSystemStorage, 'exists') as exists:
+            response = self.client.get(reverse('file-view', args=[file_instance.id]))
+            self.assertEqual(b''.join(response.streaming_content), content)
+            response.close()
+        size.assert_not_called()
+        exists.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_backfill_command(self):
+        file_instance = self.create_file(b'legacy bytes', name='notes.txt')
+        call_command('backfill_file_metadata', stdout=StringIO())
+        file_instance.refresh_from_db()
+        self.assertEqual(file_instance.size, 12)
+        self.assertEqual(file_instance.content_type, 'text/plain')
+        self.assertEqual(file_instance.checksum, hashlib.sha256(b'legacy bytes').hexdigest())
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class FileListCacheTests(FileTestCase):
+    def test_pages_are_cached_until_files_change(self):
+        self.create_file(name='first.txt')
+        self.assertEqual(self.client.get(reverse('file-list'))['X-Cache'], 'MISS')
+        hits = file_list_stats.hits
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('file-list'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(file_list_stats.hits, hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('second.txt', b'2')]}, format='multipart')
+        response = self.client.get(reverse('file-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([item['name'] for item in response.data['results']], ['first.txt', 'second.txt'])
+
+    def test_rename_invalidates_listing(self):
+        file_instance = self.create_file(name='old.txt')
+        self.client.get(reverse('file-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('file-update', args=[file_instance.id]), {'name': 'new.txt'})
+        response = self.client.get(reverse('file-list'))
+        self.assertEqual(response.data['results'][0]['name'], 'new.txt')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_does_not_cache_lists(self):
+        self.create_file()
+        self.client.get(reverse('file-list'))
+        self.assertEqual(self.client.get(reverse('file-list'))['X-Cache'], 'MISS')
+
+
+class UserProfileTests(FileTestCase):
+    def test_unchanged_profile_returns_304(self):
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['email'], self.user.email)
+
+        response = self.client.get(reverse('profile'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_saving_user_changes_validators_and_body(self):
+        etag = self.client.get(reverse('profile'))['ETag']
+        hits = profile_stats.hits
+        self.client.get(reverse('profile'))
+        self.assertEqual(profile_stats.hits, hits + 1)
+
+        self.user.first_name = 'Changed'
+        self.user.save()
+        response = self.client.get(reverse('profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['first_name'], 'Changed')
+
+    def test_upload_counter_change_invalidates_profile(self):
+        etag = self.client.get(reverse('profile'))['ETag']
+        User.objects.claim_file_slots(self.user.pk, 1)
+        self.user.refresh_from_db()
+        response = self.client.get(reverse('profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['no_of_files_uploaded'], 1)
+
+
+THROTTLED_REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ('account.authentication.CachedJWTAuthentication',),
+    'DEFAULT_THROTTLE_RATES': {'login': '3/min', 'login_email': '2/min', 'password_reset_email': '1/hour'},
+}
+
+
+@override_settings(REST_FRAMEWORK=THROTTLED_REST_FRAMEWORK)
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        create_user()
+
+    def login(self, email, password='wrong'):
+        return APIClient().post(reverse('login'), {'email': email, 'password': password})
+
+    def test_login_is_throttled_per_email_before_hashing(self):
+        self.assertEqual(self.login('user@example.com').status_code, 400)
+        self.assertEqual(self.login('USER@example.com').status_code, 400)
+        with mock.patch('account.serializers.authenticate') as authenticate, self.assertNumQueries(0):
+            response = self.login('user@example.com', 'secret-pass-123')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+
+    def test_login_is_throttled_per_ip(self):
+        for i in range(3):
+            self.login(f'other{i}@example.com')
+        self.assertEqual(self.login('user@example.com').status_code, 429)
+
+    def test_reset_lookup_is_one_query_and_throttled(self):
+        with self.assertNumQueries(2):  # user SELECT + outbox INSERT
+            response = APIClient().post(reverse('send-reset-password-email'), {'email': 'user@example.com'})
+        self.assertEqual(response.status_code, 200)
+        response = APIClient().post(reverse('send-reset-password-email'), {'email': 'user@example.com'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+
+class TokenLifecycleTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        revocation_list.clear()
+        self.user = create_user()
+        self.tokens = get_tokens_for_user(self.user)
+
+    def test_refresh_rotates_and_old_token_is_single_use(self):
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        self.assertNotEqual(response.json()['refresh'], self.tokens['refresh'])
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotated_tokens_stay_out_of_the_in_memory_list(self):
+        self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(RevokedToken.objects.get().reason, RevokedToken.REASON_ROTATED)
+        revocation_list.clear()
+        revocation_list.sync()
+        self.assertEqual(revocation_list.entries, {})
+        response = self.client.post(reverse('token-verify'), {'token': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_verify_accepts_live_tokens_without_queries(self):
+        revocation_list.sync()
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('token-verify'), {'token': self.tokens['access']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        response = client.post(reverse('logout'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        self.assertEqual(client.get(reverse('profile')).status_code, 401)
+        self.assertEqual(self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']}).status_code, 401)
+        self.assertEqual(self.client.post(reverse('token-verify'), {'token': self.tokens['access']}).status_code, 401)
+
+    def test_revocations_from_other_processes_are_synced(self):
+        access = AccessToken(self.tokens['access'])
+        RevokedToken.objects.create(jti=access['jti'], expires_at=timezone.now() + timedelta(minutes=5))
+        revocation_list.clear()
+        self.assertTrue(is_revoked(access))
+
+    def test_expired_records_are_pruned(self):
+        RevokedToken.objects.create(jti='old', expires_at=timezone.now() - timedelta(minutes=1))
+        RevokedToken.objects.create(jti='live', expires_at=timezone.now() + timedelta(minutes=1))
+        call_command('prune_revoked_tokens', stdout=StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+# Served through AsyncClient, i.e. the ASGI handler; the hashing of uploads and
+# file reads happen on worker threads with their own database connections
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncFileTransferTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = create_user()
+        self.auth = {'headers': {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}}
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_async_download_streams_body_and_ranges(self):
+        file_instance = await sync_to_async(build_file)(SimpleUploadedFile('a.txt', b'0123456789'), 'a.txt', self.user)
+        await file_instance.asave()
+
+        response = await self.async_client.get(reverse('async-file-view', args=[file_instance.id]), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(await self.read(response), b'0123456789')
+
+        response = await self.async_client.get(reverse('async-file-view', args=[file_instance.id]), headers={**self.auth['headers'], 'Range': 'bytes=2-4'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(await self.read(response), b'234')
+
+    async def test_async_endpoints_require_authentication(self):
+        response = await self.async_client.get(reverse('async-file-view', args=[1]))
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(reverse('async-file-view', args=[999]), **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_upload_stores_files(self):
+        response = await self.async_client.post(
+            reverse('async-file-upload'), {'file': [SimpleUploadedFile('a.txt', b'async'), SimpleUploadedFile('b.txt', b'upload')]}, **self.auth,
+        )
+        self.assertEqual(response.status_code, 201)
+        names = [name async for name in File.objects.filter(user=self.user).order_by('name').values_list('name', flat=True)]
+        self.assertEqual(names, ['a.txt', 'b.txt'])
+        await self.user.arefresh_from_db()
+        self.assertEqual(self.user.no_of_files_uploaded, 2)
+
+
+class SignedDownloadTests(FileTestCase):
+    def signed_url(self, file_instance, **params):
+        response = self.client.get(reverse('file-signed-url', args=[file_instance.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['url']
+
+    def test_signed_url_streams_without_database(self):
+        file_instance = self.create_file(b'signed bytes', name='report.txt')
+        url = self.signed_url(file_instance)
+        client = APIClient()
+        with self.assertNumQueries(0):
+            response = client.get(url)
+            body = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b'signed bytes')
+        self.assertIn('report.txt', response['Content-Disposition'])
+
+    def test_tampered_or_expired_links_are_refused(self):
+        url = self.signed_url(self.create_file())
+        self.assertEqual(APIClient().get(url.replace('/signed/', '/signed/x')).status_code, 403)
+        with mock.patch('account.downloads.time.time', return_value=time.time() + 3600):
+            self.assertEqual(APIClient().get(url).status_code, 403)
+
+    def test_offload_hands_the_file_to_the_proxy(self):
+        file_instance = self.create_file()
+        url = self.signed_url(file_instance)
+        with mock.patch('account.downloads.DOWNLOAD_OFFLOAD', 'x-accel-redirect'):
+            response = APIClient().get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + file_instance.file.name)
+        self.assertEqual(response.content, b'')
+        with mock.patch('account.downloads.DOWNLOAD_OFFLOAD', 'x-sendfile'):
+            response = APIClient().get(url)
+        self.assertEqual(response['X-Sendfile'], file_instance.file.path)
+
+    def test_offload_path_is_percent_encoded(self):
+        file_instance = self.create_file(name='résumé.txt')
+        with mock.patch('account.downloads.DOWNLOAD_OFFLOAD', 'x-accel-redirect'):
+            response = APIClient().get(self.signed_url(file_instance))
+        self.assertTrue(response['X-Accel-Redirect'].endswith('/r%C3%A9sum%C3%A9.txt'))
+
+
+@mock.patch('account.compression.FILE_COMPRESSION', 'gzip')
+class CompressionTests(FileTestCase):
+    TEXT = b'id,name,amount\n' + b''.join(b'%d,customer %d,%d.00\n' % (i, i % 50, i * 3) for i in range(5000))
+
+    def upload(self, name, content):
+        response = self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile(name, content)]}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(name=name)
+
+    def test_compressible_upload_is_stored_compressed(self):
+        file_instance = self.upload('data.csv', self.TEXT)
+        self.assertEqual(file_instance.encoding, 'gzip')
+        self.assertEqual(file_instance.size, len(self.TEXT))
+        self.assertLess(file_instance.stored_size, len(self.TEXT) // 3)
+        self.assertEqual(file_instance.checksum, hashlib.sha256(self.TEXT).hexdigest())
+        with file_instance.file.open('rb') as stored:
+            self.assertEqual(gzip.decompress(stored.read()), self.TEXT)
+
+    def test_download_is_decoded_or_passed_through(self):
+        file_instance = self.upload('data.csv', self.TEXT)
+        response = self.client.get(reverse('file-view', args=[file_instance.id]))
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Length'], str(len(self.TEXT)))
+        self.assertEqual(b''.join(response.streaming_content), self.TEXT)
+
+        response = self.client.get(reverse('file-view', args=[file_instance.id]), HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), file_instance.stored_size)
+        self.assertEqual(gzip.decompress(body), self.TEXT)
+
+    def test_incompressible_upload_is_stored_raw(self):
+        file_instance = self.upload('photo.png', b'\x89PNG\r\n\x1a\n' + os.urandom(4096))
+        self.assertEqual(file_instance.encoding, '')
+        file_instance = self.upload('noise.bin', os.urandom(4096))
+        self.assertEqual(file_instance.encoding, '')
+
+    def test_archive_and_report_read_decoded_content(self):
+        self.upload('data.csv', self.TEXT)
+        response = self.client.get(reverse('file-archive'))
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read('data.csv'), self.TEXT)
+
+        out = StringIO()
+        call_command('compression_report', stdout=out)
+        self.assertIn('text/csv', out.getvalue())
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SAMPLE_RATE=1.0)
+class MetricsTests(FileTestCase):
+    def test_requests_are_measured_and_exported(self):
+        file_instance = self.create_file(b'metered bytes')
+        self.client.get(reverse('file-list'))
+        response = self.client.get(reverse('file-view', args=[file_instance.id]))
+        b''.join(response.streaming_content)
+        self.client.post(reverse('file-upload'), {'file': [SimpleUploadedFile('up.txt', b'x' * 100)]}, format='multipart')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('http_requests_total{view="file-list",method="GET",status="200"}', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="file-list",le="+Inf"}', text)
+        self.assertIn('db_queries_per_request_count{view="file-list"}', text)
+        self.assertRegex(text, r'http_response_body_bytes_total\{view="file-view"\} \d+')
+        self.assertRegex(text, r'http_request_body_bytes_total\{view="file-upload"\} \d+')
+        self.assertIn('cache_requests_total{cache="file_list",result="miss"}', text)
+
+    async def test_queries_are_sampled_under_asgi(self):
+        user_cache.clear()
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        response = await self.async_client.get(reverse('profile'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        text = await sync_to_async(render_metrics)()
+        self.assertRegex(text, r'db_queries_per_request_count\{view="profile"\} \d+')
+        self.assertRegex(text, r'db_query_seconds_total\{view="profile"\} \d')
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_are_not_served(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
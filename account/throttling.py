@@ -0,0 +1,57 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# Login, registration and password reset are throttled per client IP and per
+# submitted email. Each view names a throttle_scope; the rates come from
+# REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] under '<scope>' (per IP) and
+# '<scope>_email' (per email), and a scope without a rate is not limited.
+# The sliding-window history lives in THROTTLE_CACHE_ALIAS, so every worker
+# shares the same counters. Throttles run before the handler, i.e. before
+# any password hashing, user lookup or email is queued.
+THROTTLE_CACHE_ALIAS = getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')
+
+class ScopedRateThrottle(SimpleRateThrottle):
+    cache = caches[THROTTLE_CACHE_ALIAS]
+    scope_suffix = ''
+
+    def __init__(self):
+        # The rate depends on the view, so it is resolved in allow_request
+        pass
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope:
+            return True
+        self.scope = scope + self.scope_suffix
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+class IPRateThrottle(ScopedRateThrottle):
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+class EmailRateThrottle(ScopedRateThrottle):
+    scope_suffix = '_email'
+
+    # Requests without a usable email are left to the IP throttle and validation
+    def get_cache_key(self, request, view):
+        try:
+            email = request.data.get('email')
+        except AttributeError:
+            return None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        ident = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+AUTH_THROTTLE_CLASSES = [IPRateThrottle, EmailRateThrottle]
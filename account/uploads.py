@@ -0,0 +1,217 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.utils import timezone
+
+from account.compression import compression_encoding, compressor, is_compressible
+from account.storage import guess_content_type
+
+# Chunked upload sessions keep their parts on local disk until they are finalized
+UPLOAD_SESSION_DIR = 'upload_sessions'
+UPLOAD_SESSION_TTL = getattr(settings, 'UPLOAD_SESSION_TTL', timedelta(hours=24))
+UPLOAD_CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+UPLOAD_MIN_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Multipart uploads to upload/ are written straight into this directory next to
+# the final storage location, so saving them is a rename rather than a copy
+UPLOAD_INCOMING_DIR = os.path.join(UPLOAD_SESSION_DIR, 'incoming')
+UPLOAD_MAX_FILE_SIZE = getattr(settings, 'FILE_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+UPLOAD_MAX_REQUEST_SIZE = getattr(settings, 'FILE_UPLOAD_MAX_REQUEST_SIZE', 512 * 1024 * 1024)
+# None allows any type; entries may be exact ('application/pdf') or 'image/*'
+UPLOAD_ALLOWED_TYPES = getattr(settings, 'FILE_UPLOAD_ALLOWED_TYPES', None)
+
+# A file already sitting on local disk. FileSystemStorage moves anything that
+# exposes temporary_file_path() into place instead of copying it.
+class LocalFile(DjangoFile):
+    def temporary_file_path(self):
+        return self.file.name
+
+def session_dir(session_id):
+    return default_storage.path(os.path.join(UPLOAD_SESSION_DIR, str(session_id)))
+
+def chunk_path(session_id, index):
+    return os.path.join(session_dir(session_id), f'{index}.part')
+
+def session_expiry():
+    return timezone.now() + UPLOAD_SESSION_TTL
+
+# Copy a request body into a part file, returning (size, sha256). The part is
+# written under a temporary name and renamed so a retried or parallel PUT of
+# the same chunk never leaves a half-written file behind.
+def write_chunk(session_id, index, stream, length):
+    os.makedirs(session_dir(session_id), exist_ok=True)
+    final_path = chunk_path(session_id, index)
+    temp_path = f'{final_path}.{os.getpid()}.{id(stream)}.tmp'
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(temp_path, 'wb') as part:
+            while written < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not data:
+                    break
+                digest.update(data)
+                part.write(data)
+                written += len(data)
+        os.replace(temp_path, final_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return written, digest.hexdigest()
+
+# Concatenate every part into one file inside the session directory,
+# hashing the content on the way through
+def assemble_chunks(session):
+    assembled_path = os.path.join(session_dir(session.id), 'assembled')
+    digest = hashlib.sha256()
+    with open(assembled_path, 'wb') as assembled:
+        for index in range(session.total_chunks):
+            with open(chunk_path(session.id, index), 'rb') as part:
+                while data := part.read(COPY_BUFFER_SIZE):
+                    digest.update(data)
+                    assembled.write(data)
+    local_file = LocalFile(open(assembled_path, 'rb'), name=session.name)
+    local_file.sha256 = digest.hexdigest()
+    return local_file
+
+def remove_session_files(session_id):
+    shutil.rmtree(session_dir(session_id), ignore_errors=True)
+
+def incoming_dir():
+    return default_storage.path(UPLOAD_INCOMING_DIR)
+
+def content_type_allowed(content_type):
+    if UPLOAD_ALLOWED_TYPES is None:
+        return True
+    major = content_type.split('/', 1)[0]
+    return content_type in UPLOAD_ALLOWED_TYPES or f'{major}/*' in UPLOAD_ALLOWED_TYPES
+
+# Raised while a multipart body is being parsed to stop reading it, and by
+# the checks below
+class UploadRejected(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+# FILE_UPLOAD_MAX_SIZE and FILE_UPLOAD_ALLOWED_TYPES hold for every way content
+# arrives: upload/, async/upload/, replacements and chunked sessions
+def check_file_size(size):
+    if size > UPLOAD_MAX_FILE_SIZE:
+        raise UploadRejected(f'Files may be at most {UPLOAD_MAX_FILE_SIZE} bytes.', 413)
+
+def check_file_type(name, declared_type=None):
+    content_type = guess_content_type(name, declared_type)
+    if not content_type_allowed(content_type):
+        raise UploadRejected(f'Files of type {content_type} are not allowed.', 415)
+
+# An upload being written to incoming_dir(). It is hashed and sized as the
+# chunks arrive (see hash_content) and exposes temporary_file_path() so
+# FileSystemStorage moves it into place. Closing removes whatever was not moved.
+# With FILE_COMPRESSION on, the first chunk decides whether the upload is
+# compressed on the way to disk; content_encoding and stored_size record it.
+class StreamedUploadedFile(UploadedFile):
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        os.makedirs(incoming_dir(), exist_ok=True)
+        file = tempfile.NamedTemporaryFile(suffix='.upload', dir=incoming_dir(), delete=False)
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.content_encoding = None
+        self.compressor = None
+
+    def write_chunk(self, data):
+        if self.content_encoding is None:
+            encoding = compression_encoding()
+            self.content_encoding = encoding if encoding and is_compressible(data) else ''
+            if self.content_encoding:
+                self.compressor = compressor(self.content_encoding)
+        self.hasher.update(data)
+        self.file.write(self.compressor.compress(data) if self.compressor else data)
+
+    def finish(self, size):
+        if self.compressor:
+            self.file.write(self.compressor.flush())
+        self.content_encoding = self.content_encoding or ''
+        self.stored_size = self.file.tell()
+        self.file.flush()
+        self.file.seek(0)
+        self.size = size
+        self.sha256 = self.hasher.hexdigest()
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except FileNotFoundError:
+            pass
+
+# Upload handler for upload/: replaces Django's memory/temp-file handlers so
+# each byte is written once, and refuses the request as soon as a part header
+# shows a disallowed type or one file too many, or a part grows too large.
+class StreamingUploadHandler(FileUploadHandler):
+    def __init__(self, request=None, max_files=None):
+        super().__init__(request)
+        self.max_files = max_files
+        self.files = []
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+        if self.max_files is not None and len(self.files) >= self.max_files:
+            self.reject(UploadRejected(f'You can only upload a maximum of {self.max_files} more files.', 400))
+        try:
+            check_file_type(file_name, content_type)
+        except UploadRejected as e:
+            self.reject(e)
+        self.files.append(StreamedUploadedFile(file_name, content_type, self.charset, self.content_type_extra))
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            check_file_size(start + len(raw_data))
+        except UploadRejected as e:
+            self.reject(e)
+        self.files[-1].write_chunk(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.files[-1].finish(file_size)
+        return self.files[-1]
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        for uploaded in self.files:
+            uploaded.close()
+
+    def reject(self, rejection):
+        self.discard()
+        raise rejection
+
+# Incoming files left behind by a crashed worker
+def remove_stale_incoming(max_age):
+    root = incoming_dir()
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age.total_seconds()
+    removed = 0
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+    return removed
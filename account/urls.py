@@ -1,18 +1,34 @@
 from django.urls import path
-from account.views import UserRegistrationView, UserLoginView, UserProfileView, UserChangePasswordView, SendPasswordResetEmailView, UserPasswordResetView, FileUploadView, FileListView, FileView, FileDelete, FileUpdateView
+from account.views import UserRegistrationView, UserLoginView, UserProfileView, UserChangePasswordView, SendPasswordResetEmailView, UserPasswordResetView, FileUploadView, FileListView, FileView, FileDelete, FileUpdateView, UploadSessionCreateView, UploadSessionView, UploadChunkView, UploadSessionCompleteView, AsyncUserRegistrationView, AsyncUserLoginView, FileBatchView, FileArchiveView, TokenRefreshView, TokenVerifyView, LogoutView, AsyncFileView, AsyncFileUploadView, FileSignedUrlView, SignedFileView, metrics_view
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='register'),
     path('login/', UserLoginView.as_view(), name='login'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('token/verify/', TokenVerifyView.as_view(), name='token-verify'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('async/register/', AsyncUserRegistrationView.as_view(), name='async-register'),
+    path('async/login/', AsyncUserLoginView.as_view(), name='async-login'),
     path('upload/', FileUploadView.as_view(), name='file-upload'),
+    path('async/upload/', AsyncFileUploadView.as_view(), name='async-file-upload'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:session_id>/', UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<uuid:session_id>/chunks/<int:index>/', UploadChunkView.as_view(), name='upload-chunk'),
+    path('uploads/<uuid:session_id>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
     path('files/', FileListView.as_view(), name='file-list'),
+    path('files/archive/', FileArchiveView.as_view(), name='file-archive'),
+    path('files/batch/', FileBatchView.as_view(), name='file-batch'),
     path('files/<int:file_id>/', FileView.as_view(), name='file-view'),
+    path('async/files/<int:file_id>/', AsyncFileView.as_view(), name='async-file-view'),
+    path('files/<int:file_id>/signed-url/', FileSignedUrlView.as_view(), name='file-signed-url'),
+    path('files/signed/<str:token>/', SignedFileView.as_view(), name='file-signed-download'),
     path('files/<int:file_id>/delete/', FileDelete.as_view(), name='file-delete'),
     path('files/update/<int:file_id>/', FileUpdateView.as_view(), name='file-update'),
 
     path('profile/', UserProfileView.as_view(), name='profile'),
+    path('metrics', metrics_view, name='metrics'),
     path('changepassword/', UserChangePasswordView.as_view(), name='changepassword'),
     path('send-reset-password-email/', SendPasswordResetEmailView.as_view(), name='send-reset-password-email'),
     path('reset-password/<uid>/<token>/', UserPasswordResetView.as_view(), name='reset-password'),
@@ -1,4 +1,5 @@
 from django.core.mail import EmailMessage
+from account.models import EmailOutbox
 import os
 
 class Util:
@@ -10,4 +11,14 @@ class Util:
       from_email=os.environ.get('EMAIL_FROM'),
       to=[data['to_email']]
     )
-    email.send()
\ No newline at end of file
+    email.send()
+
+  # Store the email in the outbox; the send_queued_emails worker delivers it
+  @staticmethod
+  def queue_email(data):
+    return EmailOutbox.objects.create(
+      subject=data['subject'],
+      body=data['body'],
+      from_email=os.environ.get('EMAIL_FROM') or '',
+      to_email=data['to_email']
+    )
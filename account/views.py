@@ -1,16 +1,48 @@
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-from account.serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, UserChangePasswordSerializer, SendPasswordResetEmailSerializer, UserPasswordResetSerializer, FileListSerializer
+from account.serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, UserChangePasswordSerializer, SendPasswordResetEmailSerializer, UserPasswordResetSerializer, FileListSerializer, UploadSessionSerializer, FileBatchSerializer
 from account.renderers import UserRenderer
+from account.downloads import serve_file, sign_download, verify_download, serve_signed_file, SIGNED_URL_TTL
+from django.core import signing
+from account.archives import COMPRESSION_METHODS, stream_zip
+from account.storage import build_file, replace_file_content, release_blobs, schedule_deletion, guess_content_type
+from account.authentication import CachedJWTAuthentication
+from account.cache import get_cached_file_list, set_cached_file_list, invalidate_file_list, get_cached_profile, set_cached_profile
+from account.hashing import HashingQueueFull, run_in_hashing_pool
+from account.throttling import AUTH_THROTTLE_CLASSES
+from account.metrics import render_metrics
+from account.uploads import session_expiry, write_chunk, assemble_chunks, remove_session_files, StreamingUploadHandler, UploadRejected, UPLOAD_MAX_REQUEST_SIZE, check_file_size, check_file_type
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView as BaseTokenRefreshView, TokenVerifyView as BaseTokenVerifyView
+from account.serializers import TokenRefreshSerializer, TokenVerifySerializer, LogoutSerializer
+from account.revocation import revoke_token
+from account.signals import deferred_content_release
 from rest_framework.permissions import IsAuthenticated
-from account.models import File, User
-from django.http import HttpResponse, Http404
+from account.models import File, User, UploadSession, UploadChunk
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from rest_framework.request import Request
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ParseError
 from django.shortcuts import get_object_or_404
-from django.core.files.storage import default_storage
-from rest_framework.pagination import PageNumberPagination
-import logging, os
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.conf import settings
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+import logging
+import math
+from datetime import datetime, timezone as dt_timezone
+from collections import Counter
+
+logger = logging.getLogger(__name__)
 
 # Function to generate JWT tokens for the user
 def get_tokens_for_user(user):
@@ -22,6 +54,8 @@ def get_tokens_for_user(user):
 
 class UserRegistrationView(APIView):
     renderer_classes = [UserRenderer]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'register'
 
     # Handle user registration
     def post(self, request, format=None):
@@ -33,6 +67,8 @@ class UserRegistrationView(APIView):
 
 class UserLoginView(APIView):
     renderer_classes = [UserRenderer]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'login'
 
     # Handle user login
     def post(self, request, format=None):
@@ -42,73 +78,367 @@ class UserLoginView(APIView):
         token = get_tokens_for_user(user)
         return Response({'token': token, 'msg': 'Login Success'}, status=status.HTTP_200_OK)
 
+# Swap a refresh token for a new access token (and, with rotation, a new refresh token)
+class TokenRefreshView(BaseTokenRefreshView):
+    renderer_classes = [UserRenderer]
+    serializer_class = TokenRefreshSerializer
+
+class TokenVerifyView(BaseTokenVerifyView):
+    renderer_classes = [UserRenderer]
+    serializer_class = TokenVerifySerializer
+
+class LogoutView(APIView):
+    renderer_classes = [UserRenderer]
+    permission_classes = [IsAuthenticated]
+
+    # Revoke the given refresh token and the access token used for this request
+    def post(self, request, format=None):
+        serializer = LogoutSerializer(data=request.data, context={'user': request.user})
+        serializer.is_valid(raise_exception=True)
+        revoke_token(serializer.validated_data['token'])
+        if request.auth is not None:
+            revoke_token(request.auth)
+        return Response({'msg': 'Logout Successful'}, status=status.HTTP_200_OK)
+
+# Render a plain Django response the same way UserRenderer renders DRF ones
+def render_user_response(data, status_code):
+    response = HttpResponse(status=status_code, content_type='application/json')
+    response.content = UserRenderer().render(data, renderer_context={'response': response})
+    return response
+
+# Wrap a plain Django request in a DRF Request with its body parsed; None when it is malformed
+def parse_request(request, parser_classes):
+    drf_request = Request(request, parsers=[parser() for parser in parser_classes])
+    try:
+        drf_request.data
+    except ParseError:
+        return None
+    return drf_request
+
+# Run the same throttles as the DRF auth views; a 429 response when one refuses
+def throttled_response(request, view):
+    for throttle in AUTH_THROTTLE_CLASSES:
+        throttle = throttle()
+        if not throttle.allow_request(request, view):
+            response = render_user_response({'errors': {'detail': ['Request was throttled.']}}, status.HTTP_429_TOO_MANY_REQUESTS)
+            wait = throttle.wait()
+            if wait is not None:
+                response['Retry-After'] = str(math.ceil(wait))
+            return response
+    return None
+
+def hashing_busy_response():
+    response = render_user_response({'errors': {'non_field_errors': ['Server is busy, please retry shortly.']}}, status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
+
+# Async counterparts of the registration and login views for ASGI deployments.
+# Validation (and so password hashing) runs on the bounded hashing pool,
+# leaving the event loop free to serve other requests meanwhile.
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserRegistrationView(View):
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+    throttle_scope = 'register'
+
+    async def post(self, request, format=None):
+        request = parse_request(request, self.parser_classes)
+        if request is None:
+            return render_user_response({'errors': {'non_field_errors': ['Malformed request body.']}}, status.HTTP_400_BAD_REQUEST)
+        throttled = await sync_to_async(throttled_response)(request, self)
+        if throttled is not None:
+            return throttled
+        data = request.data
+        try:
+            serializer, user = await run_in_hashing_pool(self.register, data)
+        except HashingQueueFull:
+            return hashing_busy_response()
+        if user is None:
+            return render_user_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        token = get_tokens_for_user(user)
+        return render_user_response({'token': token, 'msg': 'Registration Successful'}, status.HTTP_201_CREATED)
+
+    def register(self, data):
+        serializer = UserRegistrationSerializer(data=data)
+        if not serializer.is_valid():
+            return serializer, None
+        return serializer, serializer.save()
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserLoginView(View):
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+    throttle_scope = 'login'
+
+    async def post(self, request, format=None):
+        request = parse_request(request, self.parser_classes)
+        if request is None:
+            return render_user_response({'errors': {'non_field_errors': ['Malformed request body.']}}, status.HTTP_400_BAD_REQUEST)
+        throttled = await sync_to_async(throttled_response)(request, self)
+        if throttled is not None:
+            return throttled
+        data = request.data
+        serializer = UserLoginSerializer(data=data)
+        try:
+            valid = await run_in_hashing_pool(serializer.is_valid)
+        except HashingQueueFull:
+            return hashing_busy_response()
+        if not valid:
+            return render_user_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        token = get_tokens_for_user(serializer.validated_data['user'])
+        return render_user_response({'token': token, 'msg': 'Login Success'}, status.HTTP_200_OK)
+
+# Tell the user how many more files they may upload
+def quota_exceeded_error(user):
+    user.refresh_from_db(fields=['no_of_files_uploaded'])
+    remaining_slots = max(0, settings.MAX_FILES_PER_USER - user.no_of_files_uploaded)
+    return {'error': f'You can only upload a maximum of {remaining_slots} more files.'}
+
+def quota_exceeded_response(user):
+    return Response(quota_exceeded_error(user), status=status.HTTP_400_BAD_REQUEST)
+
+# Upload slots left according to the database. request.user may be a cached
+# copy that predates deletes handled by other workers, so its counter is not used.
+def remaining_upload_slots(user):
+    uploaded = User.objects.filter(pk=user.pk).values_list('no_of_files_uploaded', flat=True).first() or 0
+    return settings.MAX_FILES_PER_USER - uploaded
+
+# Refuse an upload on what its headers and the user's counter already tell,
+# before any of the body is read. Returns ((error, status code) or None,
+# remaining upload slots).
+def check_upload_headers(request, user):
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > UPLOAD_MAX_REQUEST_SIZE:
+        return ({'error': f'Uploads may be at most {UPLOAD_MAX_REQUEST_SIZE} bytes.'}, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE), 0
+    remaining_slots = remaining_upload_slots(user)
+    if remaining_slots <= 0:
+        return ({'error': 'You can only upload a maximum of 0 more files.'}, status.HTTP_400_BAD_REQUEST), 0
+    return None, remaining_slots
+
+# Stream the multipart body through StreamingUploadHandler and return the files
+def receive_uploads(request, remaining_slots):
+    request.upload_handlers.insert(0, StreamingUploadHandler(request, max_files=remaining_slots))
+    return request.FILES.getlist('file')
+
+# Claim the slots and insert the rows together so a failed insert gives the
+# slots back. Returns False when the user is over quota.
+def save_uploads(user, files):
+    with transaction.atomic():
+        if not User.objects.claim_file_slots(user.pk, len(files)):
+            return False
+        File.objects.bulk_create([build_file(file, file.name, user) for file in files])
+        invalidate_file_list(user.pk)
+    return True
+
 class FileUploadView(APIView):
     permission_classes = [IsAuthenticated]
 
-    # Handle file upload
+    # Handle file upload. Everything the headers can tell is checked before
+    # the body is read; the upload handler checks each part as it arrives.
     def post(self, request, format=None):
         user = request.user
-        files = request.FILES.getlist('file')
+        rejected, remaining_slots = check_upload_headers(request, user)
+        if rejected is not None:
+            return Response(*rejected)
+        try:
+            files = receive_uploads(request, remaining_slots)
+        except UploadRejected as e:
+            return Response({'error': e.message}, status=e.status_code)
         if files:
-            total_uploaded = user.no_of_files_uploaded
-            remaining_slots = 20 - total_uploaded
+            if not save_uploads(user, files):
+                return quota_exceeded_response(user)
+            return Response({'message': 'Files uploaded successfully.'}, status=status.HTTP_201_CREATED)
+        return Response({'error': 'No files uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if len(files) > remaining_slots:
-                return Response(
-                    {'error': f'You can only upload a maximum of {remaining_slots} more files.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+# Authenticate a plain Django request with the same JWT authentication as the
+# DRF views. Returns (user, None) or (None, 401 response).
+def authenticate_request(request):
+    authenticator = CachedJWTAuthentication()
+    try:
+        result = authenticator.authenticate(request)
+        if result is None:
+            raise NotAuthenticated()
+    except (AuthenticationFailed, NotAuthenticated) as e:
+        response = render_user_response(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+        return None, response
+    return result[0], None
+
+# Async upload for ASGI deployments. The server receives the body without
+# holding a thread; parsing, hashing and the database work run on worker
+# threads, so many slow uploads can be in flight at once.
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncFileUploadView(View):
+    async def post(self, request, format=None):
+        user, error = await sync_to_async(authenticate_request)(request)
+        if error is not None:
+            return error
+        rejected, remaining_slots = await sync_to_async(check_upload_headers)(request, user)
+        if rejected is not None:
+            return render_user_response(*rejected)
+        try:
+            files = await sync_to_async(receive_uploads, thread_sensitive=False)(request, remaining_slots)
+        except UploadRejected as e:
+            return render_user_response({'error': e.message}, e.status_code)
+        if not files:
+            return render_user_response({'error': 'No files uploaded.'}, status.HTTP_400_BAD_REQUEST)
+        if not await sync_to_async(save_uploads)(user, files):
+            return render_user_response(await sync_to_async(quota_exceeded_error)(user), status.HTTP_400_BAD_REQUEST)
+        return render_user_response({'message': 'Files uploaded successfully.'}, status.HTTP_201_CREATED)
+
+# Look up an unexpired upload session owned by the requesting user
+def get_upload_session(request, session_id):
+    return get_object_or_404(UploadSession, id=session_id, user=request.user, expires_at__gt=timezone.now())
+
+class UploadSessionCreateView(APIView):
+    permission_classes = [IsAuthenticated]
 
-            for file in files:
-                File.objects.create(file=file, name=file.name, user=user)
+    # Open a chunked upload session; the serializer caps its size and the
+    # name must map to an allowed type, as for upload/
+    def post(self, request, format=None):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            check_file_type(serializer.validated_data['name'])
+        except UploadRejected as e:
+            return Response({'error': e.message}, status=e.status_code)
+        serializer.save(user=request.user, expires_at=session_expiry())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
 
-            # Update the count of files uploaded by the user
-            user.no_of_files_uploaded += len(files)
-            user.save()
+    # Report which chunks of a session have arrived
+    def get(self, request, session_id, format=None):
+        session = get_upload_session(request, session_id)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
 
-            return Response({'message': 'Files uploaded successfully.'}, status=status.HTTP_201_CREATED)
-        return Response({'error': 'No files uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+    # Abort a session and discard its parts
+    def delete(self, request, session_id, format=None):
+        session = get_upload_session(request, session_id)
+        session.delete()
+        remove_session_files(session_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadChunkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Store one chunk; the raw request body is the chunk and X-Chunk-Checksum its SHA-256
+    def put(self, request, session_id, index, format=None):
+        session = get_upload_session(request, session_id)
+        if index >= session.total_chunks:
+            return Response({'error': 'Chunk index out of range.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        expected_size = session.chunk_length(index)
+        checksum = request.headers.get('X-Chunk-Checksum', '').lower()
+        if not checksum:
+            return Response({'error': 'X-Chunk-Checksum header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            content_length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            content_length = None
+        if content_length != expected_size:
+            return Response({'error': f'Chunk {index} must be exactly {expected_size} bytes.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        size, digest = write_chunk(session.id, index, request.stream, expected_size)
+        if size != expected_size or digest != checksum:
+            UploadChunk.objects.filter(session=session, index=index).delete()
+            return Response({'error': 'Chunk checksum mismatch.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        UploadChunk.objects.update_or_create(session=session, index=index, defaults={'size': size, 'checksum': digest})
+        UploadSession.objects.filter(id=session.id).update(expires_at=session_expiry())
+        return Response({'index': index, 'size': size, 'checksum': digest}, status=status.HTTP_200_OK)
+
+class UploadSessionCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+    # Assemble the parts into a File once every chunk has arrived. The quota
+    # is claimed before the parts are copied, and only one request per
+    # session gets to assemble it.
+    def post(self, request, session_id, format=None):
+        user = request.user
+        with transaction.atomic():
+            # Touching the row locks it on every backend, so a concurrent
+            # complete/ waits here and then finds the session gone
+            touched = UploadSession.objects.filter(
+                id=session_id, user=user, expires_at__gt=timezone.now(),
+            ).update(expires_at=session_expiry())
+            if not touched:
+                raise Http404
+            session = UploadSession.objects.get(id=session_id)
+
+            # Chunk indexes are unique and below total_chunks, so a full count means
+            # every chunk is there; the gaps are only listed when some are missing
+            if session.chunks.count() != session.total_chunks:
+                received = set(session.chunks.values_list('index', flat=True))
+                missing = [index for index in range(session.total_chunks) if index not in received]
+                return Response({'error': 'Upload is incomplete.', 'missing_chunks': missing}, status=status.HTTP_400_BAD_REQUEST)
+
+            if not User.objects.claim_file_slots(user.pk, 1):
+                return quota_exceeded_response(user)
+            assembled = assemble_chunks(session)
+            try:
+                file_instance = build_file(assembled, session.name, user)
+                file_instance.save()
+                invalidate_file_list(user.pk)
+            finally:
+                assembled.close()
+            session.delete()
+
+        remove_session_files(session_id)
+        return Response(FileListSerializer(file_instance).data, status=status.HTTP_201_CREATED)
 
 class FileListPagination(PageNumberPagination):
     page_size = 15
 
+# Keyset pagination over (uploaded_at, id): each page is an index range scan
+# with no OFFSET and no COUNT(*), however deep the client scrolls
+class FileCursorPagination(CursorPagination):
+    page_size = 15
+    ordering = ('uploaded_at', 'id')
+
 class FileListView(APIView):
     permission_classes = [IsAuthenticated]
-    pagination_class = FileListPagination
+    pagination_class = FileCursorPagination
 
-    # List files with pagination
+    # List files with cursor pagination; passing ?page= opts into page numbers and a total count
     def get(self, request, format=None):
-        user = request.user
-        files = File.objects.filter(user=user)
-        
-        paginator = FileListPagination()
+        # Pages are cached per user until their files change
+        cache_key, data = get_cached_file_list(request.user.id, request.get_full_path())
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        files = File.objects.filter(user_id=request.user.id).order_by('uploaded_at', 'id')
+
+        if FileListPagination.page_query_param in request.query_params:
+            paginator = FileListPagination()
+        else:
+            paginator = self.pagination_class()
         result_page = paginator.paginate_queryset(files, request)
 
-        logging.debug(f"Page number: {request.query_params.get('page', '1')}")
-        logging.debug(f"Number of files retrieved: {len(result_page)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('File list page %s: %d files', request.query_params.get('page', '1'), len(result_page))
 
         serializer = FileListSerializer(result_page, many=True)
-      
-        return paginator.get_paginated_response(serializer.data)
+
+        response = paginator.get_paginated_response(serializer.data)
+        set_cached_file_list(cache_key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
 
 class FileView(APIView):
     permission_classes = [IsAuthenticated]
 
     # View a file by its ID
     def get(self, request, file_id, format=None):
-        file_instance = get_object_or_404(File, id=file_id, user=request.user)
-
-        file_path = file_instance.file.path
-        if not default_storage.exists(file_path):
-            raise Http404("File does not exist")
+        file_instance = get_object_or_404(File, id=file_id, user_id=request.user.id)
 
-        with open(file_path, 'rb') as file:
-            response = HttpResponse(file.read(), content_type=self.get_content_type(file_instance.name))
-            response['Content-Disposition'] = f'attachment; filename="{file_instance.name}"'
-            return response
+        # Stream the file in bounded chunks, answering range and conditional requests
+        content_type = file_instance.content_type or self.get_content_type(file_instance.name)
+        return serve_file(request, file_instance, content_type)
 
     # Determine the content type of a file
     def get_content_type(self, filename):
@@ -116,6 +446,80 @@ class FileView(APIView):
         mime_type, _ = mimetypes.guess_type(filename)
         return mime_type or 'application/octet-stream'
 
+class FileSignedUrlView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Mint a signed, expiring download URL; ?expires_in= asks for a lifetime in seconds
+    def get(self, request, file_id, format=None):
+        file_instance = get_object_or_404(File, id=file_id, user_id=request.user.id)
+        try:
+            expires_in = int(request.query_params.get('expires_in', SIGNED_URL_TTL))
+        except ValueError:
+            return Response({'error': 'expires_in must be a number of seconds.'}, status=status.HTTP_400_BAD_REQUEST)
+        if expires_in <= 0:
+            return Response({'error': 'expires_in must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        token, expires = sign_download(file_instance, expires_in)
+        return Response({
+            'url': request.build_absolute_uri(reverse('file-signed-download', args=[token])),
+            'expires_at': datetime.fromtimestamp(expires, tz=dt_timezone.utc).isoformat(),
+        }, status=status.HTTP_200_OK)
+
+# Download through a signed URL: the signature is the credential, so there is
+# no JWT check and no database query, and with FILE_DOWNLOAD_OFFLOAD set the
+# front proxy sends the bytes
+class SignedFileView(View):
+    def get(self, request, token):
+        try:
+            payload = verify_download(token)
+        except signing.SignatureExpired:
+            return render_user_response({'detail': 'Download link expired.'}, status.HTTP_403_FORBIDDEN)
+        except signing.BadSignature:
+            return render_user_response({'detail': 'Invalid download link.'}, status.HTTP_403_FORBIDDEN)
+        return serve_signed_file(request, payload)
+
+# Async download for ASGI deployments: the row is fetched with an async query
+# and the body is read on worker threads between awaited sends, so a slow
+# client holds no thread while it drains the response.
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncFileView(View):
+    async def get(self, request, file_id, format=None):
+        user, error = await sync_to_async(authenticate_request)(request)
+        if error is not None:
+            return error
+        try:
+            file_instance = await File.objects.aget(id=file_id, user_id=user.id)
+        except File.DoesNotExist:
+            return render_user_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+        content_type = file_instance.content_type or guess_content_type(file_instance.name)
+        try:
+            return await sync_to_async(serve_file, thread_sensitive=False)(request, file_instance, content_type, asynchronous=True)
+        except Http404:
+            return render_user_response({'detail': 'File does not exist'}, status.HTTP_404_NOT_FOUND)
+
+class FileArchiveView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Stream a ZIP of all the user's files, or of ?ids=1,2,3; ?compression=deflate compresses entries
+    def get(self, request, format=None):
+        compression = COMPRESSION_METHODS.get(request.query_params.get('compression', 'store'))
+        if compression is None:
+            return Response({'error': f'compression must be one of {", ".join(COMPRESSION_METHODS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        files = File.objects.filter(user_id=request.user.id).order_by('id')
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                files = files.filter(id__in=[int(file_id) for file_id in ids.split(',')])
+            except ValueError:
+                return Response({'error': 'ids must be a comma-separated list of file IDs.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Rows are fetched in chunks as the archive is written, never all at once
+        response = StreamingHttpResponse(stream_zip(files.iterator(chunk_size=200), compression), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="files.zip"'
+        return response
+
 class FileDelete(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -124,15 +528,13 @@ class FileDelete(APIView):
         file_instance = get_object_or_404(File, id=file_id, user=request.user)
         user = request.user
 
-        # Delete the file from storage
-        file_instance.file.delete(save=False)
-        
-        # Delete the file instance
-        file_instance.delete()
-
-        # Decrement the user's file count and save the user instance
-        user.no_of_files_uploaded = max(0, user.no_of_files_uploaded - 1)
-        user.save()
+        # Delete the file instance and decrement the user's file count together,
+        # without rewriting the whole user row. The stored bytes are released by
+        # the post_delete signal and removed later by the garbage collector.
+        with transaction.atomic():
+            file_instance.delete()
+            User.objects.release_file_slots(user.pk, 1)
+            invalidate_file_list(user.pk)
 
         return Response({'message': 'File deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
@@ -148,39 +550,112 @@ class FileUpdateView(APIView):
         new_name = request.data.get('name', file_instance.name)
         new_file = request.FILES.get('file', None)
 
-        # Handle file renaming
-        if new_name and new_name != file_instance.name:
-            old_file_path = file_instance.file.path
-            new_file_path = os.path.join(os.path.dirname(old_file_path), new_name)
-            
-            # Rename the file in the filesystem
-            os.rename(old_file_path, new_file_path)
-            
-            # Update the file path in the model
-            file_instance.file.name = os.path.join(os.path.dirname(file_instance.file.name), new_name)
+        # The storage key never changes on rename; only the display name does
+        renamed = bool(new_name) and new_name != file_instance.name
+        if renamed:
             file_instance.name = new_name
 
-        # Update the file if provided
         if new_file:
-            file_instance.file.delete(save=False)  # Delete the old file from storage
-            file_instance.file.save(new_file.name, new_file)
+            # New content is held to the same size and type limits as upload/;
+            # its type follows the display name, as when it was first uploaded
+            try:
+                check_file_size(new_file.size)
+                check_file_type(file_instance.name, new_file.content_type)
+            except UploadRejected as e:
+                return Response({'error': e.message}, status=e.status_code)
+
+            # Swap in the new content together with the name
+            file_instance.uploaded_at = timezone.now()  # New content, so download validators change too
+            with transaction.atomic():
+                replace_file_content(file_instance, new_file)
+                invalidate_file_list(user.pk)
+        elif renamed:
+            # A rename alone is one UPDATE of the name column, with no storage access
+            file_instance.save(update_fields=['name'])
+            invalidate_file_list(user.pk)
 
-        # Save the changes
-        file_instance.save()
-        
         # Serialize the updated file instance
         serializer = FileListSerializer(file_instance)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class FileBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Apply many deletes, renames and fetches with one set-based query per kind of operation
+    def post(self, request, format=None):
+        serializer = FileBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_id = request.user.pk
+        delete_ids = list(dict.fromkeys(serializer.validated_data['delete']))
+        renames = {item['id']: item['name'] for item in serializer.validated_data['rename']}
+        fetch_ids = list(dict.fromkeys(serializer.validated_data['fetch']))
+
+        with transaction.atomic():
+            owned = {
+                row['id']: row for row in File.objects.select_for_update()
+                .filter(user_id=user_id, id__in=set(delete_ids) | set(renames)).values('id', 'blob_id', 'file')
+            }
+
+            rename_ids = [file_id for file_id in renames if file_id in owned]
+            if rename_ids:
+                File.objects.filter(id__in=rename_ids).update(
+                    name=Case(*[When(id=file_id, then=Value(renames[file_id])) for file_id in rename_ids], output_field=CharField()),
+                )
+
+            deleted = [owned[file_id] for file_id in delete_ids if file_id in owned]
+            if deleted:
+                # The per-row post_delete release would run one UPDATE per blob;
+                # it is skipped here and the references are released below in
+                # one grouped update. Other delete receivers still run.
+                with deferred_content_release():
+                    File.objects.filter(id__in=[row['id'] for row in deleted]).delete()
+                User.objects.release_file_slots(user_id, len(deleted))
+                release_blobs(Counter(row['blob_id'] for row in deleted if row['blob_id']))
+                schedule_deletion([row['file'] for row in deleted if not row['blob_id']])
+            if rename_ids or deleted:
+                invalidate_file_list(user_id)
+
+        files = {
+            file_instance.id: file_instance
+            for file_instance in File.objects.filter(user_id=user_id, id__in=set(fetch_ids) | set(rename_ids))
+        }
+        results = [
+            {'id': file_id, 'op': 'delete', 'status': 'deleted' if file_id in owned else 'not_found'}
+            for file_id in delete_ids
+        ]
+        for op, ids in (('rename', renames), ('fetch', fetch_ids)):
+            for file_id in ids:
+                if file_id in files:
+                    results.append({'id': file_id, 'op': op, 'status': 'ok', 'file': FileListSerializer(files[file_id]).data})
+                else:
+                    results.append({'id': file_id, 'op': op, 'status': 'not_found'})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
 class UserProfileView(APIView):
     renderer_classes = [UserRenderer]
     permission_classes = [IsAuthenticated]
 
-    # Retrieve user profile information
+    # Retrieve user profile information. Validators come from updated_at, so
+    # an unchanged profile is answered with a bodyless 304, and the rendered
+    # body is cached until the user is saved again.
     def get(self, request, format=None):
-        serializer = UserProfileSerializer(request.user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        user = request.user
+        etag = quote_etag(f'{user.pk}-{user.updated_at.timestamp()}')
+        last_modified = int(user.updated_at.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            body = get_cached_profile(user)
+            if body is None:
+                body = UserRenderer().render(UserProfileSerializer(user).data)
+                set_cached_profile(user, body)
+            response = HttpResponse(body, content_type=UserRenderer.media_type)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 class UserChangePasswordView(APIView):
     renderer_classes = [UserRenderer]
@@ -194,6 +669,8 @@ class UserChangePasswordView(APIView):
 
 class SendPasswordResetEmailView(APIView):
     renderer_classes = [UserRenderer]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'password_reset'
 
     # Send password reset email
     def post(self, request, format=None):
@@ -209,3 +686,9 @@ class UserPasswordResetView(APIView):
         serializer = UserPasswordResetSerializer(data=request.data, context={'uid': uid, 'token': token})
         serializer.is_valid(raise_exception=True)
         return Response({'msg': 'Password Reset Successfully'}, status=status.HTTP_200_OK)
+
+# Prometheus text exposition of this process's metrics (see account.metrics)
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'account.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -88,13 +89,45 @@ DATABASES = {
     }
 }
 
+# Use PostgreSQL when it is configured in the environment
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB'),
+        'USER': os.environ.get('POSTGRES_USER'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
 # JWT Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'account.authentication.CachedJWTAuthentication',
+    ),
+    # Auth endpoint limits: '<scope>' is per client IP, '<scope>_email' per
+    # submitted email. Set NUM_PROXIES when running behind a reverse proxy so
+    # the client IP is taken from X-Forwarded-For.
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '30/min',
+        'login_email': '10/min',
+        'register': '20/hour',
+        'register_email': '5/hour',
+        'password_reset': '10/hour',
+        'password_reset_email': '3/hour',
+    },
 }
 
+# Cache holding the throttle history; must be shared by all workers in production
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Users behind JWTs are cached per process ('local') or in the default cache
+# ('shared') for this many seconds; saves and deletes evict them at once.
+# Read-only views can use account.authentication.StatelessJWTAuthentication
+# to skip the lookup entirely.
+AUTH_USER_CACHE = 'local'
+AUTH_USER_CACHE_TTL = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -131,8 +164,31 @@ SIMPLE_JWT = {
 
     'JTI_CLAIM': 'jti',
 
+    # Refresh tokens are single use; account.revocation records the old one
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': False,
 }
 
+# Revoked tokens are checked against a per-process copy of the RevokedToken
+# table refreshed this often (seconds). Run `manage.py prune_revoked_tokens`
+# periodically to drop rows for tokens that have expired anyway.
+REVOKED_TOKEN_SYNC_INTERVAL = 5
+
+# Password hashing: PBKDF2 with a configurable work factor. Hashes made with
+# another iteration count are upgraded on the user's next successful login.
+PASSWORD_HASHERS = [
+    'account.hashing.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = 720000
+
+# Bounded thread pool used by the async login/registration views
+PASSWORD_HASHING_WORKERS = 4
+PASSWORD_HASHING_QUEUE_SIZE = 32
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -172,4 +228,79 @@ EMAIL_USE_TLS = True
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
-]
\ No newline at end of file
+]
+
+# File downloads are streamed to the client in chunks of this many bytes
+FILE_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Signed download URLs (files/<id>/signed-url/) last this many seconds by
+# default, and at most FILE_SIGNED_URL_MAX_TTL
+FILE_SIGNED_URL_TTL = 300
+FILE_SIGNED_URL_MAX_TTL = 3600
+
+# Let the front proxy send signed downloads: 'x-accel-redirect' for nginx,
+# with an internal location serving MEDIA_ROOT at FILE_DOWNLOAD_ACCEL_PREFIX:
+#     location /protected/ { internal; alias /path/to/media/; }
+# or 'x-sendfile' for Apache/lighttpd. None streams them from Django.
+FILE_DOWNLOAD_OFFLOAD = None
+FILE_DOWNLOAD_ACCEL_PREFIX = '/protected/'
+
+# Chunked upload sessions expire this long after their last chunk arrives
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Maximum number of files a user may have uploaded at once
+MAX_FILES_PER_USER = 20
+
+# Limits for uploaded content: upload/ enforces them while the body streams in;
+# file replacements and chunked upload sessions are held to them as well.
+# FILE_UPLOAD_ALLOWED_TYPES = None accepts any type, e.g. ['image/*', 'application/pdf']
+FILE_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+FILE_UPLOAD_MAX_REQUEST_SIZE = 512 * 1024 * 1024
+FILE_UPLOAD_ALLOWED_TYPES = None
+
+# Store compressible uploads compressed: None, 'gzip' or 'zstd' (needs the
+# zstandard package, otherwise gzip is used). Already-compressed formats are
+# detected from their first bytes and stored as they are. See
+# `manage.py compression_report` for space saved and CPU cost per type.
+FILE_COMPRESSION = None
+
+# Password reset emails are queued and delivered by `manage.py send_queued_emails`
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30       # Seconds before the first retry, doubled on each failure
+
+# Store identical uploads once under blobs/ and share them between File rows.
+# `manage.py dedupe_files` converts files uploaded before this was enabled.
+FILE_DEDUPLICATION = True
+
+# Deleted files are removed from storage by `manage.py collect_garbage` once
+# their tombstones are this old; `manage.py scan_orphans` finds strays
+GC_GRACE_PERIOD = timedelta(minutes=5)
+
+# File list pages are cached per user in this cache and dropped whenever the
+# user's files change. It must be shared by all workers in production (e.g.
+# redis, memcached or database); with a locmem cache lists are not cached.
+FILE_LIST_CACHE_ALIAS = 'default'
+FILE_LIST_CACHE_TTL = 300
+
+# Rendered profile bodies are cached here until the user is saved
+PROFILE_CACHE_ALIAS = 'default'
+PROFILE_CACHE_TTL = 300
+
+# Request metrics served at /metrics in the Prometheus text format. When
+# disabled the middleware drops out of the stack entirely. DB query counts
+# and times are recorded for METRICS_SAMPLE_RATE of requests.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+METRICS_SAMPLE_RATE = 0.1
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'account': {'handlers': ['console'], 'level': os.environ.get('ACCOUNT_LOG_LEVEL', 'INFO')},
+    },
+}